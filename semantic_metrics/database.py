@@ -1,20 +1,165 @@
 ﻿"""Database module for persistent metric storage."""
+import atexit
 import sqlite3
 import json
-from datetime import datetime
-from typing import Dict, List, Optional
+import re
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Compact JSON for stored arrays/objects: a reusable encoder avoids building
+# one per call and skipping whitespace keeps rows (and WAL pages) smaller.
+_json_dumps = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+# Word characters FTS5's default tokenizer would index
+_SEARCH_TERM_RE = re.compile(r"\w+")
+
+# Columns update_metric may change; anything else is rejected so field
+# names can be interpolated into the generated SQL safely.
+_UPDATABLE_FIELDS = frozenset({
+    "name", "description", "calculation", "owner", "data_source",
+    "tags", "dependencies", "test_count", "usage_count"
+})
+
+# Fields stored as JSON text; everything else is bound as-is
+_FIELD_ENCODERS = {
+    "tags": _json_dumps,
+    "dependencies": _json_dumps,
+}
+
+
+class MetricRow(Mapping):
+    """
+    A metric read from the database.
+
+    Slots instead of a per-row dict keep bulk reads small. It is a
+    read-only Mapping, so existing ``metric["name"]`` and ``.get()``
+    callers keep working; use as_dict() where a plain dict is needed
+    (e.g. JSON serialization).
+    """
+
+    __slots__ = (
+        "id", "name", "description", "calculation", "owner", "data_source",
+        "tags", "dependencies", "test_count", "usage_count",
+        "created_at", "updated_at"
+    )
+
+    def __init__(self, row: Tuple):
+        (self.id, self.name, self.description, self.calculation, self.owner,
+         self.data_source, tags, dependencies, self.test_count,
+         self.usage_count, self.created_at, self.updated_at) = row
+        self.tags = json.loads(tags) if tags else []
+        self.dependencies = json.loads(dependencies) if dependencies else []
+
+    def __getitem__(self, key: str):
+        if key not in _METRIC_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__slots__)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"MetricRow({self.as_dict()!r})"
+
+    def as_dict(self) -> Dict:
+        """Return the metric as a plain dict."""
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+_METRIC_FIELDS = frozenset(MetricRow.__slots__)
+
+# Explicit column list in slot order so rows can be unpacked by position
+# rather than looked up by name.
+_METRIC_COLUMNS = ", ".join(f"m.{field}" for field in MetricRow.__slots__)
+
+
+@lru_cache(maxsize=128)
+def _build_update_sql(fields: Tuple[str, ...]) -> str:
+    """Build the UPDATE statement for a sorted tuple of field names."""
+    assignments = ", ".join(f"{field} = ?" for field in fields)
+    return f"UPDATE metrics SET {assignments}, updated_at = ? WHERE id = ?"
+
 
 class MetricsDatabase:
     """SQLite database for persistent metric storage."""
-    
+
+    # Connection settings for file-backed databases. WAL lets readers run
+    # while a write is in flight and, with synchronous=NORMAL, avoids the
+    # double fsync per commit of the default rollback journal.
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-64000",
+        "PRAGMA mmap_size=268435456",
+        "PRAGMA busy_timeout=5000",
+        # Fold the WAL back into the main file every ~1000 pages and cap the
+        # size it is truncated to afterwards, so sustained write bursts
+        # can't leave readers scanning a huge WAL.
+        "PRAGMA wal_autocheckpoint=1000",
+        "PRAGMA journal_size_limit=67108864",
+    )
+
     def __init__(self, db_path: str = "metrics.db"):
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
+        self.db_path = db_path
+        self.conn = self._connect()
         self.cursor = self.conn.cursor()
+        # All writes go through self.conn under this lock, so transactions
+        # from different threads never interleave on the shared connection
+        # or race each other for SQLite's write lock.
+        self._write_lock = threading.RLock()
+        # File databases give each reader thread its own connection so reads
+        # run concurrently under WAL; an in-memory database only exists on
+        # self.conn, so readers share it there.
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
         self._create_schema()
-    
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection with the standard settings applied."""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        # Foreign keys are off by default and must be enabled per connection
+        conn.execute("PRAGMA foreign_keys=ON")
+        if self.db_path != ":memory:":
+            for pragma in self.PRAGMAS:
+                conn.execute(pragma)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """Run a block as one serialized write transaction."""
+        with self._write_lock, self.conn:
+            yield self.conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """Return the calling thread's read connection."""
+        if self.db_path == ":memory:":
+            return self.conn
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            conn.execute("PRAGMA query_only=ON")
+            self._local.conn = conn
+            with self._write_lock:
+                self._readers.append(conn)
+        return conn
+
     def _create_schema(self):
         """Create database tables."""
+        existing_tables = {
+            row["name"] for row in self.cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            )
+        }
+
         self.cursor.execute("""
             CREATE TABLE IF NOT EXISTS metrics (
                 id TEXT PRIMARY KEY,
@@ -31,33 +176,448 @@ class MetricsDatabase:
                 updated_at TEXT
             )
         """)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS metric_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                metric_id TEXT,
+                field_name TEXT,
+                old_value TEXT,
+                new_value TEXT,
+                changed_by TEXT,
+                changed_at TEXT,
+                FOREIGN KEY (metric_id) REFERENCES metrics(id) ON DELETE CASCADE
+            )
+        """)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS validation_tests (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                metric_id TEXT,
+                test_type TEXT,
+                test_query TEXT,
+                expected_result TEXT,
+                last_run TEXT,
+                status TEXT,
+                FOREIGN KEY (metric_id) REFERENCES metrics(id) ON DELETE CASCADE
+            )
+        """)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS metric_usage (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                metric_id TEXT,
+                used_by TEXT,
+                used_at TEXT,
+                context TEXT,
+                FOREIGN KEY (metric_id) REFERENCES metrics(id) ON DELETE CASCADE
+            )
+        """)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS trust_score_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                metric_id TEXT NOT NULL,
+                score REAL NOT NULL,
+                breakdown TEXT,
+                recorded_at TEXT,
+                FOREIGN KEY (metric_id) REFERENCES metrics(id) ON DELETE CASCADE
+            )
+        """)
+
+        # Tags are also kept in a junction table so tag lookups are an index
+        # seek instead of decoding every row's JSON array.
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS metric_tags (
+                metric_id TEXT,
+                tag TEXT,
+                PRIMARY KEY (metric_id, tag),
+                FOREIGN KEY (metric_id) REFERENCES metrics(id) ON DELETE CASCADE
+            )
+        """)
+        self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_metric_tags_tag
+            ON metric_tags(tag, metric_id)
+        """)
+        if "metric_tags" not in existing_tables:
+            # Backfill databases created before the junction table existed
+            self.cursor.execute("""
+                INSERT OR IGNORE INTO metric_tags (metric_id, tag)
+                SELECT metrics.id, tag.value
+                FROM metrics, json_each(metrics.tags) AS tag
+            """)
+
+        # Composite indexes match the (metric_id = ?, timestamp range/order)
+        # shape of the history and stats queries, so SQLite can seek to the
+        # metric's date slice and skip the sort step.
+        self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_usage_metric_time
+            ON metric_usage(metric_id, used_at DESC)
+        """)
+        self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_history_metric_time
+            ON metric_history(metric_id, changed_at DESC)
+        """)
+        self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_trust_history_metric
+            ON trust_score_history(metric_id, recorded_at DESC)
+        """)
+        # Nothing reads validation_tests by metric yet, but ON DELETE CASCADE
+        # does: without an index every delete_metric scans the whole table.
+        self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_validation_tests_metric
+            ON validation_tests(metric_id)
+        """)
+
+        # Full-text index over name/description for search_metrics. It keeps
+        # its own copy of the text (keyed by metric id) rather than pointing
+        # at metrics.rowid, which VACUUM may renumber on a TEXT-keyed table.
+        self.cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS metrics_fts
+            USING fts5(id UNINDEXED, name, description)
+        """)
+        self.cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS metrics_fts_insert AFTER INSERT ON metrics BEGIN
+                INSERT INTO metrics_fts (id, name, description)
+                VALUES (new.id, new.name, new.description);
+            END
+        """)
+        self.cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS metrics_fts_delete AFTER DELETE ON metrics BEGIN
+                DELETE FROM metrics_fts WHERE id = old.id;
+            END
+        """)
+        self.cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS metrics_fts_update
+            AFTER UPDATE OF name, description ON metrics BEGIN
+                DELETE FROM metrics_fts WHERE id = old.id;
+                INSERT INTO metrics_fts (id, name, description)
+                VALUES (new.id, new.name, new.description);
+            END
+        """)
+        if "metrics_fts" not in existing_tables:
+            self.cursor.execute("""
+                INSERT INTO metrics_fts (id, name, description)
+                SELECT id, name, description FROM metrics
+            """)
         self.conn.commit()
+
+        # Refresh planner statistics only where SQLite thinks it will help;
+        # a plain ANALYZE would rescan every index on each startup.
+        self.conn.execute("PRAGMA optimize")
     
-    def create_metric(self, metric: Dict) -> None:
-        """Create a new metric."""
-        self.cursor.execute("""
-            INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            metric["id"], metric["name"], metric["description"],
-            metric["calculation"], metric["owner"], metric.get("data_source"),
-            json.dumps(metric.get("tags", [])),
-            json.dumps(metric.get("dependencies", [])),
-            metric.get("test_count", 0), metric.get("usage_count", 0),
-            metric["created_at"], metric["updated_at"]
-        ))
-        self.conn.commit()
-    
-    def get_metric(self, metric_id: str) -> Optional[Dict]:
+    def create_metric(self, metric: Dict) -> str:
+        """Create a new metric and return its ID."""
+        self.create_metrics_bulk([metric])
+        return metric["id"]
+
+    def create_metrics_bulk(self, metrics: List[Dict]) -> None:
+        """Create many metrics in a single transaction."""
+        now = datetime.now().isoformat()
+        params = [
+            (
+                metric["id"], metric["name"], metric.get("description"),
+                metric.get("calculation"), metric.get("owner"), metric.get("data_source"),
+                _json_dumps(metric.get("tags", [])),
+                _json_dumps(metric.get("dependencies", [])),
+                metric.get("test_count", 0), metric.get("usage_count", 0),
+                metric.get("created_at", now), metric.get("updated_at", now)
+            )
+            for metric in metrics
+        ]
+        # One commit for the whole batch instead of one fsync per row;
+        # the context manager rolls back if any row fails.
+        with self._write() as conn:
+            conn.executemany("""
+                INSERT INTO metrics (
+                    id, name, description, calculation, owner, data_source,
+                    tags, dependencies, test_count, usage_count,
+                    created_at, updated_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, params)
+            conn.executemany(
+                "INSERT OR IGNORE INTO metric_tags (metric_id, tag) VALUES (?, ?)",
+                [
+                    (metric["id"], tag)
+                    for metric in metrics
+                    for tag in metric.get("tags", [])
+                ]
+            )
+
+    def get_metric(self, metric_id: str) -> Optional[MetricRow]:
         """Get a metric by ID."""
-        self.cursor.execute("SELECT * FROM metrics WHERE id = ?", (metric_id,))
-        row = self.cursor.fetchone()
-        if row:
-            metric = dict(row)
-            metric["tags"] = json.loads(metric.get("tags") or "[]")
-            metric["dependencies"] = json.loads(metric.get("dependencies") or "[]")
-            return metric
-        return None
-    
+        row = self._reader().execute(
+            f"SELECT {_METRIC_COLUMNS} FROM metrics m WHERE m.id = ?", (metric_id,)
+        ).fetchone()
+        return MetricRow(row) if row else None
+
+    def get_all_metrics(self) -> List[MetricRow]:
+        """Get all metrics ordered by name."""
+        return list(self.iter_all_metrics())
+
+    def iter_all_metrics(self, batch_size: int = 512) -> Iterator[MetricRow]:
+        """Stream all metrics ordered by name, fetching rows in batches."""
+        cursor = self._reader().execute(
+            f"SELECT {_METRIC_COLUMNS} FROM metrics m ORDER BY m.name"
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from map(MetricRow, rows)
+
+    def update_metric(self, metric_id: str, updates: Dict, changed_by: str = "system") -> None:
+        """Update metric fields and record each change in metric_history."""
+        self.update_metrics_bulk([(metric_id, updates, changed_by)])
+
+    def update_metrics_bulk(self, updates: List[Tuple[str, Dict, str]]) -> None:
+        """
+        Apply many (metric_id, updates, changed_by) changes in one transaction.
+
+        Changes are applied in order, so later entries see earlier ones in
+        their history rows. If any metric is missing, none are updated.
+        """
+        for _, changes, _ in updates:
+            unknown = set(changes) - _UPDATABLE_FIELDS
+            if unknown:
+                raise ValueError(f"Cannot update unknown field(s): {', '.join(sorted(unknown))}")
+
+        now = datetime.now().isoformat()
+        with self._write() as conn:
+            for metric_id, changes, changed_by in updates:
+                if not changes:
+                    continue
+
+                # Sorted so the same set of fields always maps to the same
+                # cached statement text, which also hits SQLite's
+                # prepared-statement cache.
+                fields = tuple(sorted(changes))
+                values = [
+                    _FIELD_ENCODERS[field](changes[field]) if field in _FIELD_ENCODERS else changes[field]
+                    for field in fields
+                ]
+
+                # Read the old values under the write lock so the history
+                # rows can't miss a concurrent update to the same metric.
+                current = conn.execute(
+                    "SELECT * FROM metrics WHERE id = ?", (metric_id,)
+                ).fetchone()
+                if current is None:
+                    raise ValueError(f"Metric '{metric_id}' not found")
+
+                conn.execute(_build_update_sql(fields), (*values, now, metric_id))
+                conn.executemany("""
+                    INSERT INTO metric_history
+                        (metric_id, field_name, old_value, new_value, changed_by, changed_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, [
+                    (metric_id, field, current[field], value, changed_by, now)
+                    for field, value in zip(fields, values)
+                ])
+                if "tags" in changes:
+                    conn.execute("DELETE FROM metric_tags WHERE metric_id = ?", (metric_id,))
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO metric_tags (metric_id, tag) VALUES (?, ?)",
+                        [(metric_id, tag) for tag in changes["tags"]]
+                    )
+
+    def delete_metric(self, metric_id: str) -> None:
+        """Delete a metric; child rows are removed by ON DELETE CASCADE."""
+        with self._write() as conn:
+            conn.execute("DELETE FROM metrics WHERE id = ?", (metric_id,))
+
+    def get_metric_history(self, metric_id: str, limit: int = 50) -> List[Dict]:
+        """Get the change history for a metric, most recent first."""
+        rows = self._reader().execute("""
+            SELECT field_name, old_value, new_value, changed_by, changed_at
+            FROM metric_history
+            WHERE metric_id = ?
+            ORDER BY changed_at DESC, id DESC
+            LIMIT ?
+        """, (metric_id, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_trend_counts(self, metric_id: str) -> Tuple[int, int]:
+        """
+        Count a metric's changes in the last 30 days and in the 30 before that.
+
+        Ages are whole days, matching trust_scoring.calculate_trend, so the
+        buckets are "less than 31 days old" and "31 to 60 days old".
+        """
+        now = datetime.now()
+        recent_from = (now - timedelta(days=31)).isoformat()
+        older_from = (now - timedelta(days=61)).isoformat()
+        # ISO timestamps sort as text, so both buckets come from one seek
+        # into the metric's slice of idx_history_metric_time
+        row = self._reader().execute("""
+            SELECT COUNT(CASE WHEN changed_at > ? THEN 1 END),
+                   COUNT(CASE WHEN changed_at <= ? THEN 1 END)
+            FROM metric_history
+            WHERE metric_id = ? AND changed_at > ?
+        """, (recent_from, recent_from, metric_id, older_from)).fetchone()
+        return row[0], row[1]
+
+    def search_metrics(self, query: str) -> List[MetricRow]:
+        """
+        Search metrics by name or description.
+        
+        Each word in the query is matched as a token prefix, so "rev"
+        finds "Revenue". Results are ranked by BM25 relevance, then usage.
+        """
+        terms = _SEARCH_TERM_RE.findall(query)
+        if not terms:
+            return self.get_all_metrics()
+
+        # Quote every term so user input can't inject FTS5 query syntax
+        match = " ".join(f'"{term}"*' for term in terms)
+        rows = self._reader().execute(f"""
+            SELECT {_METRIC_COLUMNS} FROM metrics_fts f
+            JOIN metrics m ON m.id = f.id
+            WHERE metrics_fts MATCH ?
+            ORDER BY bm25(metrics_fts), m.usage_count DESC
+        """, (match,)).fetchall()
+        return list(map(MetricRow, rows))
+
+    def get_metrics_by_owner(self, owner: str) -> List[MetricRow]:
+        """Get all metrics owned by a team or person."""
+        rows = self._reader().execute(
+            f"SELECT {_METRIC_COLUMNS} FROM metrics m WHERE m.owner = ? ORDER BY m.name",
+            (owner,)
+        ).fetchall()
+        return list(map(MetricRow, rows))
+
+    def get_metrics_by_tag(self, tag: str) -> List[MetricRow]:
+        """Get all metrics carrying a tag."""
+        rows = self._reader().execute(f"""
+            SELECT {_METRIC_COLUMNS} FROM metrics m
+            JOIN metric_tags t ON t.metric_id = m.id
+            WHERE t.tag = ?
+            ORDER BY m.name
+        """, (tag,)).fetchall()
+        return list(map(MetricRow, rows))
+
+    def add_validation_test(self, metric_id: str, test: Dict, updated_at: Optional[str] = None) -> None:
+        """
+        Record a validation test and bump the metric's test count.
+
+        If ``updated_at`` is given, the metric's timestamp is set to it in the
+        same transaction.
+        """
+        with self._write() as conn:
+            conn.execute("""
+                INSERT INTO validation_tests
+                    (metric_id, test_type, test_query, expected_result, last_run, status)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (
+                metric_id, test.get("test_type"), test.get("test_query"),
+                test.get("expected_result"),
+                test.get("last_run", datetime.now().isoformat()),
+                test.get("status")
+            ))
+            # Counter is maintained in place; recounting the child table
+            # would make every insert O(tests for this metric).
+            if updated_at is None:
+                conn.execute(
+                    "UPDATE metrics SET test_count = test_count + 1 WHERE id = ?",
+                    (metric_id,)
+                )
+            else:
+                conn.execute(
+                    "UPDATE metrics SET test_count = test_count + 1, updated_at = ? WHERE id = ?",
+                    (updated_at, metric_id)
+                )
+
+    def record_usage(self, metric_id: str, used_by: str, context: Optional[str] = None) -> None:
+        """Record a metric usage event and bump the metric's usage count."""
+        with self._write() as conn:
+            conn.execute("""
+                INSERT INTO metric_usage (metric_id, used_by, used_at, context)
+                VALUES (?, ?, ?, ?)
+            """, (metric_id, used_by, datetime.now().isoformat(), context))
+            conn.execute(
+                "UPDATE metrics SET usage_count = usage_count + 1 WHERE id = ?",
+                (metric_id,)
+            )
+
+    def get_usage_stats(self, metric_id: str, days: int = 30) -> Dict:
+        """Get usage statistics for a metric over the last N days."""
+        # ISO timestamps sort lexically, so a >= bound on the string is a
+        # range scan over idx_usage_metric_time.
+        from_date = (datetime.now() - timedelta(days=days)).isoformat()
+        row = self._reader().execute("""
+            SELECT COUNT(*) AS total_uses,
+                   COUNT(DISTINCT used_by) AS unique_users,
+                   MAX(used_at) AS last_used
+            FROM metric_usage
+            WHERE metric_id = ? AND used_at >= ?
+        """, (metric_id, from_date)).fetchone()
+        return {
+            "metric_id": metric_id,
+            "days": days,
+            "total_uses": row["total_uses"],
+            "unique_users": row["unique_users"],
+            "last_used": row["last_used"]
+        }
+
+    def record_trust_score(self, metric_id: str, score: float, breakdown: Dict) -> None:
+        """Record a trust score snapshot for trend analysis."""
+        with self._write() as conn:
+            conn.execute("""
+                INSERT INTO trust_score_history (metric_id, score, breakdown, recorded_at)
+                VALUES (?, ?, ?, ?)
+            """, (metric_id, score, _json_dumps(breakdown), datetime.now().isoformat()))
+
+    def get_trust_score_history(self, metric_id: str, days: int = 90) -> List[Dict]:
+        """Get trust score snapshots from the last N days, most recent first."""
+        from_date = (datetime.now() - timedelta(days=days)).isoformat()
+        rows = self._reader().execute("""
+            SELECT score, breakdown, recorded_at
+            FROM trust_score_history
+            WHERE metric_id = ? AND recorded_at >= ?
+            ORDER BY recorded_at DESC, id DESC
+        """, (metric_id, from_date)).fetchall()
+
+        history = []
+        for row in rows:
+            entry = dict(row)
+            entry["breakdown"] = json.loads(entry["breakdown"] or "{}")
+            history.append(entry)
+        return history
+
     def close(self):
-        """Close database connection."""
+        """Close database connections."""
+        with self._write_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+            if self.db_path != ":memory:":
+                # Leave an empty WAL behind so the next open starts clean
+                self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
         self.conn.close()
+
+
+# Shared databases handed out by get_db(), keyed by path
+_SHARED_DBS: Dict[str, MetricsDatabase] = {}
+_SHARED_DBS_LOCK = threading.Lock()
+
+
+def get_db(db_path: str = "metrics.db") -> MetricsDatabase:
+    """
+    Return the process-wide database for ``db_path``, opening it on first use.
+
+    MetricsDatabase already serializes writes and gives each thread its own
+    reader, so one instance can serve every caller. Callers must not close
+    it; shared databases are closed when the interpreter exits.
+    """
+    db = _SHARED_DBS.get(db_path)
+    if db is None:
+        with _SHARED_DBS_LOCK:
+            db = _SHARED_DBS.get(db_path)
+            if db is None:
+                db = _SHARED_DBS[db_path] = MetricsDatabase(db_path)
+    return db
+
+
+@atexit.register
+def _close_shared_dbs() -> None:
+    """Close every database opened through get_db()."""
+    with _SHARED_DBS_LOCK:
+        for db in _SHARED_DBS.values():
+            db.close()
+        _SHARED_DBS.clear()
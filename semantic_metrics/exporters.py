@@ -1,6 +1,91 @@
 """BI tool export utilities for Looker and Tableau."""
+import json
 import re
-from typing import Dict, Any, Optional
+from functools import lru_cache
+from typing import Dict, Any, Callable, FrozenSet, NamedTuple, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+# Patterns shared by the Looker and Tableau converters, compiled once
+_TABLE_COL_RE = re.compile(r'\b\w+\.(\w+)\b')
+_FROM_RE = re.compile(r'\s+FROM\s+\w+', re.IGNORECASE)
+_WHERE_RE = re.compile(r'\s+WHERE\s+(.*)$', re.IGNORECASE | re.DOTALL)
+_AGG_RE = re.compile(r'\b(SUM|AVG|AVERAGE|COUNT|MAX|MIN)\s*\(\s*(DISTINCT\b)?', re.IGNORECASE)
+# A dash followed by another; XML comments may not contain "--"
+_DOUBLE_DASH_RE = re.compile(r'-(?=-)')
+
+# Looker measure types in priority order when a calculation mixes aggregates
+_LOOKER_TYPES = (
+    ('SUM', 'sum'),
+    ('AVG', 'average'),
+    ('COUNT_DISTINCT', 'count_distinct'),
+    ('COUNT', 'count'),
+    ('MAX', 'max'),
+    ('MIN', 'min'),
+)
+
+
+class _ParsedCalculation(NamedTuple):
+    """
+    A calculation split into an expression and an optional WHERE filter.
+    
+    Both parts are stored as alternating (text, column, text, ...)
+    segments with table qualifiers removed, so each exporter only has
+    to format the column names.
+    """
+    expression: Tuple[str, ...]
+    filter: Tuple[str, ...]
+
+
+@lru_cache(maxsize=1024)
+def _parse_calculation(calculation: str) -> _ParsedCalculation:
+    """Parse a calculation once and share the result across exporters."""
+    sql = _FROM_RE.sub('', calculation)
+    where = _WHERE_RE.search(sql)
+    if where:
+        expression, condition = sql[:where.start()], where.group(1)
+    else:
+        expression, condition = sql, ''
+    return _ParsedCalculation(
+        tuple(_TABLE_COL_RE.split(expression.strip())),
+        tuple(_TABLE_COL_RE.split(condition.strip())) if condition.strip() else (),
+    )
+
+
+def _render(segments: Tuple[str, ...], column: Callable[[str], str]) -> str:
+    """Join parsed segments, formatting every column name with `column`."""
+    return ''.join(
+        column(segment) if i % 2 else segment
+        for i, segment in enumerate(segments)
+    )
+
+
+@lru_cache(maxsize=1024)
+def _find_aggregations(calculation: str) -> FrozenSet[str]:
+    """
+    Find the aggregate functions used in a calculation in a single scan.
+    
+    Cached so the Looker and Tableau exporters share the work when the
+    same metric is exported to both.
+    """
+    found = set()
+    for func, distinct in _AGG_RE.findall(calculation):
+        func = func.upper()
+        if func == 'AVERAGE':
+            func = 'AVG'
+        elif func == 'COUNT' and distinct:
+            func = 'COUNT_DISTINCT'
+        found.add(func)
+    return frozenset(found)
+
+
+def _comment_text(text: str) -> str:
+    """Collapse newlines and whitespace runs so text stays on one comment line."""
+    return ' '.join(text.split())
+
+
+def _xml_comment_text(text: str) -> str:
+    """Comment-safe text for an XML comment: one line, no "--" sequences."""
+    return _DOUBLE_DASH_RE.sub('', _comment_text(text))
 
 
 def determine_looker_type(calculation: str) -> str:
@@ -13,21 +98,21 @@ def determine_looker_type(calculation: str) -> str:
     Returns:
         Looker measure type (sum, average, count, etc.)
     """
-    calc_upper = calculation.upper()
-    if 'SUM(' in calc_upper:
-        return 'sum'
-    elif 'AVG(' in calc_upper or 'AVERAGE(' in calc_upper:
-        return 'average'
-    elif 'COUNT(DISTINCT' in calc_upper:
-        return 'count_distinct'
-    elif 'COUNT(' in calc_upper:
-        return 'count'
-    elif 'MAX(' in calc_upper:
-        return 'max'
-    elif 'MIN(' in calc_upper:
-        return 'min'
-    else:
-        return 'number'
+    aggregations = _find_aggregations(calculation)
+    for func, measure_type in _LOOKER_TYPES:
+        if func in aggregations:
+            return measure_type
+    return 'number'
+
+
+def _looker_field(column: str) -> str:
+    """Format a column as a Looker field reference."""
+    return f'${{{column}}}'
+
+
+def _tableau_field(column: str) -> str:
+    """Format a column as a Tableau field reference."""
+    return f'[{column}]'
 
 
 def convert_to_looker_sql(calculation: str, view_name: str) -> str:
@@ -41,25 +126,20 @@ def convert_to_looker_sql(calculation: str, view_name: str) -> str:
     Returns:
         Looker-formatted SQL string
     """
-    sql = calculation
+    parsed = _parse_calculation(calculation)
     
     # Replace table.column with ${column}
     # e.g., "transactions.amount" -> "${amount}"
-    sql = re.sub(r'\b\w+\.(\w+)\b', r'${\1}', sql)
-    
-    # Remove table references from FROM clause
-    sql = re.sub(r'\s+FROM\s+\w+', '', sql, flags=re.IGNORECASE)
+    sql = _render(parsed.expression, _looker_field)
     
     # Convert WHERE to Looker filters (simplified)
     # Full implementation would need SQL parser
-    if 'WHERE' in sql.upper():
-        # Extract WHERE clause for documentation
-        where_match = re.search(r'WHERE\s+(.+)', sql, flags=re.IGNORECASE)
-        if where_match:
-            # Add as comment for now
-            sql = sql.replace(where_match.group(0), f'\n    # Filter: {where_match.group(1)}')
+    if parsed.filter:
+        # Add as comment for now
+        # One comment line, even when the WHERE clause spans several
+        sql += f'\n    # Filter: {_comment_text(_render(parsed.filter, _looker_field))}'
     
-    return sql.strip()
+    return sql
 
 
 def convert_to_tableau_formula(calculation: str) -> str:
@@ -72,19 +152,10 @@ def convert_to_tableau_formula(calculation: str) -> str:
     Returns:
         Tableau-formatted formula string
     """
-    formula = calculation
-    
-    # Replace table.column with [column]
+    # Replace table.column with [column]; FROM and WHERE clauses are
+    # dropped (Tableau handles these as filters)
     # e.g., "transactions.amount" -> "[amount]"
-    formula = re.sub(r'\b\w+\.(\w+)\b', r'[\1]', formula)
-    
-    # Remove FROM clauses
-    formula = re.sub(r'\s+FROM\s+\w+', '', formula, flags=re.IGNORECASE)
-    
-    # Remove WHERE clauses (Tableau handles these as filters)
-    formula = re.sub(r'\s+WHERE\s+.*$', '', formula, flags=re.IGNORECASE)
-    
-    return formula.strip()
+    return _render(_parse_calculation(calculation).expression, _tableau_field)
 
 
 def determine_tableau_datatype(calculation: str) -> str:
@@ -97,12 +168,10 @@ def determine_tableau_datatype(calculation: str) -> str:
     Returns:
         Tableau data type (integer, real, string, etc.)
     """
-    calc_upper = calculation.upper()
-    if 'COUNT(' in calc_upper:
+    aggregations = _find_aggregations(calculation)
+    if 'COUNT' in aggregations or 'COUNT_DISTINCT' in aggregations:
         return 'integer'
-    elif 'SUM(' in calc_upper or 'AVG(' in calc_upper or 'AVERAGE(' in calc_upper:
-        return 'real'
-    elif 'MAX(' in calc_upper or 'MIN(' in calc_upper:
+    elif aggregations:
         return 'real'
     else:
         return 'string'
@@ -128,39 +197,39 @@ def generate_lookml(
     looker_sql = convert_to_looker_sql(metric['calculation'], view_name)
     
     # Build LookML
-    lookml = f"""view: {view_name} {{
+    parts = [f"""view: {view_name} {{
   measure: {metric['id']} {{
-    label: "{metric['name']}"
-    description: "{metric.get('description', '')}"
+    label: {json.dumps(metric['name'], ensure_ascii=False)}
+    description: {json.dumps(metric.get('description') or '', ensure_ascii=False)}
     type: {measure_type}
     sql: {looker_sql} ;;
-"""
+"""]
     
     # Add tags as metadata
     if metric.get('tags'):
-        tags_str = ', '.join(f'"{tag}"' for tag in metric['tags'])
-        lookml += f"    tags: [{tags_str}]\n"
+        tags_str = ', '.join(json.dumps(tag, ensure_ascii=False) for tag in metric['tags'])
+        parts.append(f"    tags: [{tags_str}]\n")
     
     # Add owner as comment
     if metric.get('owner'):
-        lookml += f"    # Owner: {metric['owner']}\n"
+        parts.append(f"    # Owner: {_comment_text(metric['owner'])}\n")
     
     # Add trust score as comment
     if metric.get('trust_score') is not None:
-        lookml += f"    # Trust Score: {metric['trust_score']:.1f}%\n"
+        parts.append(f"    # Trust Score: {metric['trust_score']:.1f}%\n")
     
     # Add dependencies as comment
     if metric.get('dependencies'):
-        deps_str = ', '.join(metric['dependencies'])
-        lookml += f"    # Dependencies: {deps_str}\n"
+        deps_str = ', '.join(map(_comment_text, metric['dependencies']))
+        parts.append(f"    # Dependencies: {deps_str}\n")
     
-    lookml += "  }\n}\n"
+    parts.append("  }\n}\n")
     
     # Add explore context if provided
     if explore:
-        lookml += f"\n# Use in explore: {explore}\n"
+        parts.append(f"\n# Use in explore: {explore}\n")
     
-    return lookml
+    return ''.join(parts)
 
 
 def generate_tds(metric: Dict[str, Any], connection: str) -> str:
@@ -176,42 +245,43 @@ def generate_tds(metric: Dict[str, Any], connection: str) -> str:
     """
     tableau_formula = convert_to_tableau_formula(metric['calculation'])
     datatype = determine_tableau_datatype(metric['calculation'])
+    metric_id = quoteattr(metric['id'])
     
     # Build TDS XML
-    tds = f"""<?xml version='1.0' encoding='utf-8' ?>
+    parts = [f"""<?xml version='1.0' encoding='utf-8' ?>
 <datasource>
   <connection class='federated'>
     <named-connections>
-      <named-connection name='{connection}' />
+      <named-connection name={quoteattr(connection)} />
     </named-connections>
   </connection>
   
-  <column name='{metric['id']}' datatype='{datatype}' role='measure'>
-    <calculation class='tableau' formula='{tableau_formula}' />
-    <desc>{metric.get('description', '')}</desc>
+  <column name={metric_id} datatype='{datatype}' role='measure'>
+    <calculation class='tableau' formula={quoteattr(tableau_formula)} />
+    <desc>{escape(metric.get('description') or '')}</desc>
     <aliases>
-      <alias key='{metric['name']}' value='{metric['id']}' />
+      <alias key={quoteattr(metric['name'])} value={metric_id} />
     </aliases>
-"""
+"""]
     
     # Add metadata as XML comments
     if metric.get('tags'):
-        tags_str = ', '.join(metric['tags'])
-        tds += f"    <!-- Tags: {tags_str} -->\n"
+        tags_str = ', '.join(map(_xml_comment_text, metric['tags']))
+        parts.append(f"    <!-- Tags: {tags_str} -->\n")
     
     if metric.get('owner'):
-        tds += f"    <!-- Owner: {metric['owner']} -->\n"
+        parts.append(f"    <!-- Owner: {_xml_comment_text(metric['owner'])} -->\n")
     
     if metric.get('trust_score') is not None:
-        tds += f"    <!-- Trust Score: {metric['trust_score']:.1f}% -->\n"
+        parts.append(f"    <!-- Trust Score: {metric['trust_score']:.1f}% -->\n")
     
     if metric.get('dependencies'):
-        deps_str = ', '.join(metric['dependencies'])
-        tds += f"    <!-- Dependencies: {deps_str} -->\n"
+        deps_str = ', '.join(map(_xml_comment_text, metric['dependencies']))
+        parts.append(f"    <!-- Dependencies: {deps_str} -->\n")
     
-    tds += "  </column>\n</datasource>\n"
+    parts.append("  </column>\n</datasource>\n")
     
-    return tds
+    return ''.join(parts)
 
 
 def export_to_power_bi(metric: Dict[str, Any]) -> str:
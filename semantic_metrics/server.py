@@ -13,22 +13,233 @@ Demonstrates UX design for:
 """
 
 import sys
+import asyncio
+import io
 import json
+import math
 import re
-from typing import Dict, List, Optional, Any
+from bisect import bisect_left, bisect_right
+from heapq import nlargest
+from operator import itemgetter
+from typing import Dict, FrozenSet, Iterator, List, Optional, Any, Set, Tuple
 from datetime import datetime
-from collections import defaultdict
+from functools import lru_cache
+from string import Template
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass, field, fields
 
 from mcp.server.fastmcp import FastMCP
 from mcp.server.fastmcp.prompts import base
-from semantic_metrics.trust_scoring import calculate_trust_score_enhanced, generate_sparkline, get_score_emoji, get_score_label
+from semantic_metrics.database import MetricsDatabase, get_db
+from semantic_metrics.trust_scoring import CONSISTENCY_WINDOW, _parse_timestamp, calculate_trust_score_enhanced, generate_sparkline, get_score_emoji, get_score_label
+
+class MetricsServer(FastMCP):
+    """
+    FastMCP server with back-pressure on tool calls.
+    
+    The MCP session already dispatches each incoming request as its own
+    task, so async tools overlap; this caps how many run at once so a
+    burst of calls can't pile up unbounded work on the loop.
+    """
+    
+    def __init__(self, name: str, max_concurrent_requests: int = 32, **settings: Any):
+        super().__init__(name, **settings)
+        self._request_slots = asyncio.Semaphore(max_concurrent_requests)
+    
+    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> Any:
+        """Call a tool once a request slot is free."""
+        async with self._request_slots:
+            return await super().call_tool(name, arguments)
+
+
+class Report(io.StringIO):
+    """Text buffer that tools append their response to line by line."""
+    
+    def __init__(self, text: str = ""):
+        # StringIO(text) would leave the position at 0 and overwrite it
+        super().__init__()
+        self.write(text)
+    
+    def line(self, text: str = "") -> None:
+        """Append text followed by a newline."""
+        self.write(text)
+        self.write("\n")
+
 
 # Create the FastMCP server
-mcp = FastMCP("semantic-metrics-assistant")
+mcp = MetricsServer("semantic-metrics-assistant", max_concurrent_requests=32)
+
+# Most results a single search lists
+SEARCH_RESULT_LIMIT = 50
+
+# Spaces and dashes become underscores in Mermaid node ids, in one pass
+_NODE_ID_TRANS = str.maketrans(" -", "__")
+
+@dataclass(slots=True)
+class Metric:
+    """
+    A metric definition held in METRICS_STORE.
+    
+    Underscored fields are lookup data derived once at construction
+    (parsed timestamps, lowercased text, token sets, diagram node ids)
+    plus the cached trust score; they are left out of to_dict().
+    """
+    name: str
+    id: str
+    description: str
+    calculation: str
+    owner: str = "Unassigned"
+    tags: List[str] = field(default_factory=list)
+    data_source: str = ""
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    updated_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    dependencies: List[str] = field(default_factory=list)
+    usage_count: int = 0
+    test_count: int = 0
+    documentation_complete: bool = False
+    _updated_at_dt: Optional[datetime] = field(default=None, init=False, repr=False, compare=False)
+    _name_lc: str = field(default="", init=False, repr=False, compare=False)
+    _desc_lc: str = field(default="", init=False, repr=False, compare=False)
+    _tags_lc: FrozenSet[str] = field(default=frozenset(), init=False, repr=False, compare=False)
+    _desc_tokens: FrozenSet[str] = field(default=frozenset(), init=False, repr=False, compare=False)
+    _tag_set: FrozenSet[str] = field(default=frozenset(), init=False, repr=False, compare=False)
+    _tags_json: str = field(default="[]", init=False, repr=False, compare=False)
+    _node_id: str = field(default="", init=False, repr=False, compare=False)
+    _dep_node_ids: Tuple[str, ...] = field(default=(), init=False, repr=False, compare=False)
+    _doc_points: int = field(default=0, init=False, repr=False, compare=False)
+    _owner_points: int = field(default=0, init=False, repr=False, compare=False)
+    _trust_cache: Optional[Tuple] = field(default=None, init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        # Parsed once here so scoring doesn't re-parse the ISO string
+        self._updated_at_dt = _parse_timestamp(self.updated_at)
+        # Lowercased copies for search, computed once instead of per query
+        self._name_lc = self.name.lower()
+        self._desc_lc = self.description.lower()
+        self._tags_lc = frozenset(t.lower() for t in self.tags)
+        # Token sets for similarity comparisons
+        self._desc_tokens = frozenset(self._desc_lc.split())
+        self._tag_set = frozenset(self.tags)
+        # YAML flow list for exports
+        self._tags_json = json.dumps(self.tags)
+        # Mermaid node ids for this metric and for each dependency
+        # (table references collapse to the table name)
+        self._node_id = self.id.translate(_NODE_ID_TRANS)
+        self._dep_node_ids = tuple(
+            dep.translate(_NODE_ID_TRANS).split('.')[0] for dep in self.dependencies
+        )
+        self._score_static_checks()
+    
+    def touch(self, now: Optional[datetime] = None) -> None:
+        """Mark the metric as updated (now by default) and refresh its cached scores."""
+        # Searches score metrics in a worker thread and key their cache on
+        # updated_at, so it is set last: a score keyed on the new timestamp
+        # was then computed from the new points and parsed time
+        self._score_static_checks()
+        self._updated_at_dt = now or datetime.now()
+        self._trust_cache = None
+        self.updated_at = self._updated_at_dt.isoformat()
+    
+    def _score_static_checks(self) -> None:
+        """Recompute the documentation and ownership points."""
+        # Documentation and ownership points only change when the metric is
+        # written, so trust scoring reads them instead of re-checking
+        self._doc_points = _check_documentation(self)
+        self._owner_points = _check_ownership(self)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the public fields as a plain dict for exporters."""
+        return {name: getattr(self, name) for name in _METRIC_FIELDS}
+
+
+_METRIC_FIELDS = tuple(f.name for f in fields(Metric) if not f.name.startswith('_'))
 
 # In-memory metric repository (in production, this would be a database)
-METRICS_STORE: Dict[str, Dict[str, Any]] = {}
+METRICS_STORE: Dict[str, Metric] = {}
 LINEAGE_GRAPH: Dict[str, List[str]] = defaultdict(list)
+# Lowercased tag -> ids of metrics carrying it
+TAG_INDEX: Dict[str, Set[str]] = defaultdict(set)
+# Trigram of the lowercased name and description -> ids of metrics containing it
+TRIGRAM_INDEX: Dict[str, Set[str]] = defaultdict(set)
+
+
+class _TrieNode:
+    """Node of the metric-name suffix trie."""
+    
+    __slots__ = ("children", "ids", "link")
+    
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        # Metric ids whose name contains the path to this node, as a dict
+        # so they keep definition order
+        self.ids: Dict[str, None] = {}
+        # Node for this path minus its first character (KMP-style fallback)
+        self.link: Optional["_TrieNode"] = None
+    
+    def clear(self) -> None:
+        """Remove every indexed name."""
+        self.children.clear()
+        self.ids.clear()
+
+
+# Metric ids that lie on or depend on a dependency cycle. Recomputed for
+# the whole store on the next check after any metric is defined.
+CYCLIC_IDS: Set[str] = set()
+_scc_dirty = True
+
+# Upstream Mermaid nodes and edges by (metric id, depth), cleared with
+# the cycle set whenever a metric is defined
+_UPSTREAM_GRAPHS: Dict[Tuple[str, int], Tuple[Dict[str, Dict], List[Tuple[str, str]]]] = {}
+
+# Every suffix of every lowercased metric name, so a substring lookup is
+# a walk of len(query) nodes instead of a scan over all metrics
+NAME_TRIE = _TrieNode()
+
+# Shortest partial match _find_similar_metrics suggests names for
+_MIN_SIMILAR_MATCH = 3
+
+# Database that defined metrics are written through to, once
+# enable_persistence() has loaded the store from it
+_PERSISTENCE: Optional[MetricsDatabase] = None
+
+
+def enable_persistence(db_path: str = "metrics.db") -> int:
+    """
+    Load stored metrics into METRICS_STORE and persist later changes.
+    
+    Args:
+        db_path: SQLite database file to read from and write to
+        
+    Returns:
+        Number of metrics loaded
+    """
+    global _PERSISTENCE
+    db = get_db(db_path)
+    loaded = 0
+    for row in db.iter_all_metrics():
+        if row.id in METRICS_STORE:
+            continue
+        description = row.description or ""
+        calculation = row.calculation or ""
+        owner = row.owner or "Unassigned"
+        _store_metric(Metric(
+            name=row.name,
+            id=row.id,
+            description=description,
+            calculation=calculation,
+            owner=owner,
+            tags=row.tags,
+            data_source=row.data_source or "",
+            created_at=row.created_at,
+            updated_at=row.updated_at,
+            dependencies=row.dependencies,
+            usage_count=row.usage_count,
+            test_count=row.test_count,
+            documentation_complete=bool(description and calculation and owner != "Unassigned")
+        ))
+        loaded += 1
+    _PERSISTENCE = db
+    return loaded
 
 
 @mcp.tool()
@@ -57,7 +268,7 @@ def define_metric(
     if not name or not description or not calculation:
         return "Error: Name, description, and calculation are required"
     
-    metric_id = name.lower().replace(" ", "_")
+    metric_id = _normalize_id(name)
     
     # Check if metric already exists
     if metric_id in METRICS_STORE:
@@ -66,34 +277,32 @@ def define_metric(
     # Parse dependencies from calculation
     dependencies = _extract_dependencies(calculation)
     
-    # Create metric definition
-    metric = {
-        "name": name,
-        "id": metric_id,
-        "description": description,
-        "calculation": calculation,
-        "owner": owner or "Unassigned",
-        "tags": [t.strip() for t in tags.split(",")] if tags else [],
-        "data_source": data_source,
-        "created_at": datetime.now().isoformat(),
-        "updated_at": datetime.now().isoformat(),
-        "dependencies": dependencies,
-        "usage_count": 0,
-        "test_count": 0,
-        "documentation_complete": bool(description and calculation and owner)
-    }
+    # Create metric definition; one clock read for its timestamps and score
+    now = datetime.now()
+    stamp = now.isoformat()
+    metric = Metric(
+        name=name,
+        id=metric_id,
+        description=description,
+        calculation=calculation,
+        owner=owner or "Unassigned",
+        tags=[t.strip() for t in tags.split(",")] if tags else [],
+        data_source=data_source,
+        created_at=stamp,
+        updated_at=stamp,
+        dependencies=dependencies,
+        documentation_complete=bool(description and calculation and owner)
+    )
     
     # Store metric
-    METRICS_STORE[metric_id] = metric
-    
-    # Update lineage graph
-    for dep in dependencies:
-        LINEAGE_GRAPH[dep].append(metric_id)
+    _store_metric(metric)
+    if _PERSISTENCE is not None:
+        _PERSISTENCE.create_metric(metric.to_dict())
     
     # Calculate initial trust score
-    trust_score = _calculate_trust_score(metric)
+    trust_score = _calculate_trust_score(metric, now)
     
-    report = f"""
+    report = Report(f"""
 âœ… Metric Created: {name}
 
 ðŸ“Š Definition:
@@ -103,35 +312,35 @@ def define_metric(
 {calculation}
 
 ðŸ‘¤ Owner: {owner or "âš ï¸ Unassigned - Please assign an owner"}
-ðŸ·ï¸ Tags: {', '.join(metric['tags']) if metric['tags'] else "None"}
+ðŸ·ï¸ Tags: {', '.join(metric.tags) if metric.tags else "None"}
 ðŸ“ Data Source: {data_source or "Not specified"}
 
 ðŸ›¡ï¸ Initial Trust Score: {trust_score}/100
-"""
+""")
     
     if trust_score < 70:
-        report += "\nâš ï¸ Trust score is low. Consider:\n"
+        report.line("\nâš ï¸ Trust score is low. Consider:")
         if not owner:
-            report += "  â€¢ Assigning an owner\n"
-        if not metric['tags']:
-            report += "  â€¢ Adding relevant tags\n"
+            report.line("  â€¢ Assigning an owner")
+        if not metric.tags:
+            report.line("  â€¢ Adding relevant tags")
         if not data_source:
-            report += "  â€¢ Specifying the data source\n"
-        report += "  â€¢ Adding tests with validate_metric()\n"
+            report.line("  â€¢ Specifying the data source")
+        report.line("  â€¢ Adding tests with validate_metric()")
     
     if dependencies:
-        report += f"\nðŸ”— Dependencies detected: {', '.join(dependencies)}\n"
+        report.line(f"\nðŸ”— Dependencies detected: {', '.join(dependencies)}")
     
-    report += f"\nðŸ’¡ Next steps:\n"
-    report += f"  â€¢ Add tests: validate_metric('{name}')\n"
-    report += f"  â€¢ Check lineage: visualize_lineage('{name}')\n"
-    report += f"  â€¢ Export to dbt: export_to_dbt('{name}')\n"
+    report.line(f"\nðŸ’¡ Next steps:")
+    report.line(f"  â€¢ Add tests: validate_metric('{name}')")
+    report.line(f"  â€¢ Check lineage: visualize_lineage('{name}')")
+    report.line(f"  â€¢ Export to dbt: export_to_dbt('{name}')")
     
-    return report
+    return report.getvalue()
 
 
 @mcp.tool()
-def search_metrics(query: str = "", tags: str = "") -> str:
+async def search_metrics(query: str = "", tags: str = "") -> str:
     """
     Search for existing metrics by name, description, or tags.
     
@@ -145,49 +354,74 @@ def search_metrics(query: str = "", tags: str = "") -> str:
     if not METRICS_STORE:
         return "No metrics defined yet. Use define_metric() to create your first metric."
     
+    # define_metric grows the store and indexes on the event loop, so the
+    # candidates are picked here; the worker thread only sees this list
+    pool = _search_pool(query, tags)
+    # Scoring every candidate is CPU-bound, so run it in a worker thread to
+    # keep the event loop free for other tool calls; MetricsServer bounds
+    # how many run at once
+    return await asyncio.to_thread(_search_report, pool, query, tags)
+
+
+def _search_pool(query: str, tags: str) -> List[Metric]:
+    """Metrics that may match, narrowed with the tag and trigram indexes."""
     query_lower = query.lower() if query else ""
-    tag_filter = [t.strip().lower() for t in tags.split(",")] if tags else []
-    
-    matches = []
-    for metric_id, metric in METRICS_STORE.items():
-        # Match query in name or description
-        query_match = (
-            not query or 
-            query_lower in metric['name'].lower() or 
-            query_lower in metric['description'].lower()
-        )
-        
-        # Match tags
-        tag_match = (
-            not tag_filter or 
-            any(tag in [t.lower() for t in metric['tags']] for tag in tag_filter)
-        )
-        
-        if query_match and tag_match:
-            trust_score = _calculate_trust_score(metric)
-            matches.append((metric, trust_score))
+    tag_filter = frozenset(t.strip().lower() for t in tags.split(",")) if tags else frozenset()
+    
+    candidate_ids = None
+    if tag_filter:
+        # Metrics carrying any of the tags, straight from the tag index
+        candidate_ids = set().union(*(TAG_INDEX.get(tag, ()) for tag in tag_filter))
+    if len(query_lower) >= 3:
+        # Metrics whose text contains every trigram of the query; a superset
+        # of the real matches, confirmed by the substring check later
+        postings = sorted((TRIGRAM_INDEX.get(gram, _NO_IDS) for gram in _trigrams(query_lower)), key=len)
+        text_ids = set(postings[0]).intersection(*postings[1:])
+        candidate_ids = text_ids if candidate_ids is None else candidate_ids & text_ids
+    
+    if candidate_ids is None:
+        return list(METRICS_STORE.values())
+    # Walk the store rather than the id set so ties keep definition order
+    return [metric for metric in METRICS_STORE.values() if metric.id in candidate_ids]
+
+
+def _search_report(pool: List[Metric], query: str, tags: str) -> str:
+    """Confirm, score and rank the candidate metrics and build the search report."""
+    query_lower = query.lower() if query else ""
+    # One clock read shared by every metric scored in this search
+    now = datetime.now()
+    
+    # Match query in name or description
+    candidates = [
+        metric for metric in pool
+        if not query or query_lower in metric._name_lc or query_lower in metric._desc_lc
+    ]
+    
+    matches = list(zip(candidates, _calculate_trust_scores(candidates, now)))
     
     if not matches:
         return f"No metrics found matching '{query}' with tags '{tags}'"
     
-    # Sort by trust score descending
-    matches.sort(key=lambda x: x[1], reverse=True)
+    # Highest trust first; only the shown results need ordering
+    top = nlargest(SEARCH_RESULT_LIMIT, matches, key=itemgetter(1))
     
-    report = f"""
+    report = Report(f"""
 Search Results ({len(matches)} metrics found)
 {'=' * 50}
-"""
+""")
+    if len(matches) > len(top):
+        report.line(f"Showing the {len(top)} most trusted - refine the query to narrow results")
     
-    for metric, trust_score in matches:
-        trust_emoji = "ðŸŸ¢" if trust_score >= 80 else "ðŸŸ¡" if trust_score >= 60 else "ðŸ”´"
-        report += f"\n{trust_emoji} {metric['name']} (Trust: {trust_score}/100)\n"
-        report += f"   {metric['description']}\n"
-        report += f"   Owner: {metric['owner']}\n"
-        if metric['tags']:
-            report += f"   Tags: {', '.join(metric['tags'])}\n"
-        report += f"   Usage: {metric['usage_count']} times\n"
+    for metric, trust_score in top:
+        trust_emoji = _get_score_emoji(trust_score)
+        report.line(f"\n{trust_emoji} {metric.name} (Trust: {trust_score}/100)")
+        report.line(f"   {metric.description}")
+        report.line(f"   Owner: {metric.owner}")
+        if metric.tags:
+            report.line(f"   Tags: {', '.join(metric.tags)}")
+        report.line(f"   Usage: {metric.usage_count} times")
     
-    return report
+    return report.getvalue()
 
 
 @mcp.tool()
@@ -208,28 +442,19 @@ def check_trust_score(metric_name: str) -> str:
     Returns:
         Detailed trust score breakdown
     """
-    metric_id = metric_name.lower().replace(" ", "_")
-    
-    if metric_id not in METRICS_STORE:
-        similar = _find_similar_metrics(metric_name)
-        msg = f"âŒ Metric '{metric_name}' not found."
-        if similar:
-            msg += f"\n\nDid you mean: {', '.join(similar)}?"
-        return msg
-    
-    metric = METRICS_STORE[metric_id]
+    metric_id, metric = _resolve_metric(metric_name)
+    if metric is None:
+        return _metric_not_found(metric_name)
     
     # Calculate detailed trust scores
-    freshness_score = _check_freshness(metric)
-    test_score = _check_test_coverage(metric)
-    usage_score = _check_usage(metric)
-    doc_score = _check_documentation(metric)
-    ownership_score = _check_ownership(metric)
+    now = datetime.now()
+    breakdown = _trust_breakdown(metric, now)
+    freshness_score, test_score, usage_score, doc_score, ownership_score = breakdown
     
-    overall_score = _calculate_trust_score(metric)
+    overall_score = sum(breakdown)
     
-    report = f"""
-Trust Score Report: {metric['name']}
+    report = Report(f"""
+Trust Score Report: {metric.name}
 {'=' * 50}
 
 Overall Trust Score: {overall_score}/100
@@ -239,40 +464,40 @@ Detailed Breakdown:
 -------------------
 
 ðŸ“… Freshness: {freshness_score}/20
-{_get_check_mark(freshness_score, 15)} Updated: {_format_relative_time(metric['updated_at'])}
+{_get_check_mark(freshness_score, 15)} Updated: {_format_relative_time(metric._updated_at_dt, now)}
 {_get_freshness_recommendation(freshness_score)}
 
 ðŸ§ª Test Coverage: {test_score}/25
-{_get_check_mark(test_score, 15)} Tests: {metric['test_count']} passing
-{_get_test_recommendation(test_score, metric['test_count'])}
+{_get_check_mark(test_score, 15)} Tests: {metric.test_count} passing
+{_get_test_recommendation(test_score, metric.test_count)}
 
 ðŸ“Š Usage: {usage_score}/20
-{_get_check_mark(usage_score, 10)} Used {metric['usage_count']} times
-{_get_usage_recommendation(usage_score, metric['usage_count'])}
+{_get_check_mark(usage_score, 10)} Used {metric.usage_count} times
+{_get_usage_recommendation(usage_score, metric.usage_count)}
 
 ðŸ“– Documentation: {doc_score}/20
-{_get_check_mark(doc_score, 15)} Complete: {metric['documentation_complete']}
+{_get_check_mark(doc_score, 15)} Complete: {metric.documentation_complete}
 {_get_doc_recommendation(doc_score, metric)}
 
 ðŸ‘¤ Ownership: {ownership_score}/15
-{_get_check_mark(ownership_score, 10)} Owner: {metric['owner']}
-{_get_ownership_recommendation(ownership_score, metric['owner'])}
+{_get_check_mark(ownership_score, 10)} Owner: {metric.owner}
+{_get_ownership_recommendation(ownership_score, metric.owner)}
 
 ðŸ’¡ Recommendations:
-"""
+""")
     
     recommendations = _generate_recommendations(metric, overall_score)
     for rec in recommendations:
-        report += f"  â€¢ {rec}\n"
+        report.line(f"  â€¢ {rec}")
     
     if overall_score >= 80:
-        report += "\nðŸŽ‰ Excellent! This metric is production-ready and trustworthy.\n"
+        report.line("\nðŸŽ‰ Excellent! This metric is production-ready and trustworthy.")
     elif overall_score >= 60:
-        report += "\nðŸ‘ Good baseline. Address recommendations to increase trust.\n"
+        report.line("\nðŸ‘ Good baseline. Address recommendations to increase trust.")
     else:
-        report += "\nâš ï¸ Low trust score. Prioritize improvements before widespread use.\n"
+        report.line("\nâš ï¸ Low trust score. Prioritize improvements before widespread use.")
     
-    return report
+    return report.getvalue()
 
 
 @mcp.tool()
@@ -292,49 +517,47 @@ def visualize_lineage(metric_name: str, depth: int = 3) -> str:
     Returns:
         ASCII tree visualization of dependencies
     """
-    metric_id = metric_name.lower().replace(" ", "_")
-    
-    if metric_id not in METRICS_STORE:
-        return f"âŒ Metric '{metric_name}' not found."
+    metric_id, metric = _resolve_metric(metric_name)
+    if metric is None:
+        return _metric_not_found(metric_name)
     
-    metric = METRICS_STORE[metric_id]
-    
-    report = f"""
-Lineage for: {metric['name']}
+    report = Report(f"""
+Lineage for: {metric.name}
 {'=' * 50}
 
 ðŸ“Š This Metric:
-   {metric['description']}
-   Data Source: {metric['data_source'] or 'Not specified'}
+   {metric.description}
+   Data Source: {metric.data_source or 'Not specified'}
 
-"""
+""")
     
     # Show upstream dependencies
-    if metric['dependencies']:
-        report += "â¬†ï¸ Upstream Dependencies (what this depends on):\n"
-        report += _build_dependency_tree(metric['dependencies'], depth, "   ")
+    if metric.dependencies:
+        report.line("â¬†ï¸ Upstream Dependencies (what this depends on):")
+        report.write(_build_dependency_tree(metric.dependencies, depth, "   "))
     else:
-        report += "â¬†ï¸ Upstream Dependencies: None (base metric)\n"
+        report.line("â¬†ï¸ Upstream Dependencies: None (base metric)")
     
     # Show downstream dependents
-    report += "\nâ¬‡ï¸ Downstream Dependents (what depends on this):\n"
-    downstream = [m for m, deps in LINEAGE_GRAPH.items() if metric_id in deps]
+    report.line("\nâ¬‡ï¸ Downstream Dependents (what depends on this):")
+    # LINEAGE_GRAPH maps each dependency to the metrics that use it
+    downstream = LINEAGE_GRAPH.get(metric_id, [])
     if downstream:
         for dep in downstream:
             if dep in METRICS_STORE:
-                report += f"   â””â”€â”€ {METRICS_STORE[dep]['name']}\n"
+                report.line(f"   â””â”€â”€ {METRICS_STORE[dep].name}")
     else:
-        report += "   None (no metrics depend on this yet)\n"
+        report.line("   None (no metrics depend on this yet)")
     
     # Impact analysis
-    report += f"\nðŸŽ¯ Impact Analysis:\n"
-    report += f"   Direct dependencies: {len(metric['dependencies'])}\n"
-    report += f"   Direct dependents: {len(downstream)}\n"
+    report.line(f"\nðŸŽ¯ Impact Analysis:")
+    report.line(f"   Direct dependencies: {len(metric.dependencies)}")
+    report.line(f"   Direct dependents: {len(downstream)}")
     
     if len(downstream) > 0:
-        report += f"\nâš ï¸ Caution: Changes to this metric will affect {len(downstream)} downstream metric(s)\n"
+        report.line(f"\nâš ï¸ Caution: Changes to this metric will affect {len(downstream)} downstream metric(s)")
     
-    return report
+    return report.getvalue()
 
 
 @mcp.tool()
@@ -355,22 +578,19 @@ def validate_metric(metric_name: str, test_description: str = "") -> str:
     Returns:
         Validation results and trust score improvement
     """
-    metric_id = metric_name.lower().replace(" ", "_")
-    
-    if metric_id not in METRICS_STORE:
-        return f"âŒ Metric '{metric_name}' not found."
-    
-    metric = METRICS_STORE[metric_id]
+    metric_id, metric = _resolve_metric(metric_name)
+    if metric is None:
+        return _metric_not_found(metric_name)
     
     issues = []
     warnings = []
     
     # Check SQL syntax (basic)
-    if "SELECT" not in metric['calculation'].upper():
+    if "SELECT" not in metric.calculation.upper():
         warnings.append("âš ï¸ Calculation doesn't appear to be SQL - ensure format is correct")
     
     # Check dependencies exist
-    for dep in metric['dependencies']:
+    for dep in metric.dependencies:
         if dep not in METRICS_STORE and not _is_table_reference(dep):
             issues.append(f"âŒ Dependency '{dep}' not found - define it first or verify table name")
     
@@ -379,57 +599,65 @@ def validate_metric(metric_name: str, test_description: str = "") -> str:
         issues.append(f"âŒ Circular dependency detected!")
     
     # Check ownership
-    if metric['owner'] == "Unassigned":
+    if metric.owner == "Unassigned":
         warnings.append("âš ï¸ No owner assigned")
     
     # Check documentation
-    if not metric['data_source']:
+    if not metric.data_source:
         warnings.append("âš ï¸ Data source not specified")
     
+    # Score before and after the new test against the same clock
+    now = datetime.now()
+    old_trust = _calculate_trust_score(metric, now)
+    
     # Add test if description provided
     if test_description:
-        metric['test_count'] += 1
-        metric['updated_at'] = datetime.now().isoformat()
-    
-    old_trust = _calculate_trust_score(metric)
-    METRICS_STORE[metric_id] = metric
-    new_trust = _calculate_trust_score(metric)
-    
-    report = f"""
-Validation Report: {metric['name']}
+        metric.test_count += 1
+        metric.touch(now)
+        if _PERSISTENCE is not None:
+            _PERSISTENCE.add_validation_test(metric_id, {
+                "test_type": "manual",
+                "test_query": test_description,
+                "last_run": metric.updated_at,
+            }, updated_at=metric.updated_at)
+    
+    new_trust = _calculate_trust_score(metric, now)
+    
+    report = Report(f"""
+Validation Report: {metric.name}
 {'=' * 50}
 
-"""
+""")
     
     if not issues:
-        report += "âœ… All validation checks passed!\n\n"
+        report.line("âœ… All validation checks passed!\n")
     else:
-        report += f"âŒ {len(issues)} issue(s) found:\n"
+        report.line(f"âŒ {len(issues)} issue(s) found:")
         for issue in issues:
-            report += f"   {issue}\n"
-        report += "\n"
+            report.line(f"   {issue}")
+        report.line()
     
     if warnings:
-        report += f"âš ï¸ {len(warnings)} warning(s):\n"
+        report.line(f"âš ï¸ {len(warnings)} warning(s):")
         for warning in warnings:
-            report += f"   {warning}\n"
-        report += "\n"
+            report.line(f"   {warning}")
+        report.line()
     
     if test_description:
-        report += f"ðŸ§ª Test Added:\n"
-        report += f"   {test_description}\n"
-        report += f"   Total tests: {metric['test_count']}\n\n"
+        report.line(f"ðŸ§ª Test Added:")
+        report.line(f"   {test_description}")
+        report.line(f"   Total tests: {metric.test_count}\n")
     
-    report += f"ðŸ›¡ï¸ Trust Score: {old_trust}/100 â†’ {new_trust}/100 "
+    report.write(f"ðŸ›¡ï¸ Trust Score: {old_trust}/100 â†’ {new_trust}/100 ")
     if new_trust > old_trust:
-        report += f"(+{new_trust - old_trust}) ðŸ“ˆ\n"
+        report.line(f"(+{new_trust - old_trust}) ðŸ“ˆ")
     else:
-        report += "\n"
+        report.line()
     
     if not issues and not warnings:
-        report += "\nâœ¨ Metric is validated and ready to use!\n"
+        report.line("\nâœ¨ Metric is validated and ready to use!")
     
-    return report
+    return report.getvalue()
 
 
 @mcp.tool()
@@ -449,122 +677,160 @@ def compare_metrics(metric1_name: str, metric2_name: str) -> str:
     Returns:
         Side-by-side comparison
     """
-    metric1_id = metric1_name.lower().replace(" ", "_")
-    metric2_id = metric2_name.lower().replace(" ", "_")
-    
-    if metric1_id not in METRICS_STORE:
-        return f"âŒ Metric '{metric1_name}' not found."
-    if metric2_id not in METRICS_STORE:
-        return f"âŒ Metric '{metric2_name}' not found."
-    
-    m1 = METRICS_STORE[metric1_id]
-    m2 = METRICS_STORE[metric2_id]
-    
-    trust1 = _calculate_trust_score(m1)
-    trust2 = _calculate_trust_score(m2)
-    
-    report = f"""
+    _, m1 = _resolve_metric(metric1_name)
+    if m1 is None:
+        return _metric_not_found(metric1_name)
+    _, m2 = _resolve_metric(metric2_name)
+    if m2 is None:
+        return _metric_not_found(metric2_name)
+    
+    now = datetime.now()
+    trust1 = _calculate_trust_score(m1, now)
+    trust2 = _calculate_trust_score(m2, now)
+    
+    report = Report(f"""
 Metric Comparison
 {'=' * 50}
 
-{m1['name']} vs {m2['name']}
+{m1.name} vs {m2.name}
 
 Description:
-  1ï¸âƒ£ {m1['description']}
-  2ï¸âƒ£ {m2['description']}
+  1ï¸âƒ£ {m1.description}
+  2ï¸âƒ£ {m2.description}
 
 Calculation:
-  1ï¸âƒ£ {m1['calculation']}
-  2ï¸âƒ£ {m2['calculation']}
+  1ï¸âƒ£ {m1.calculation}
+  2ï¸âƒ£ {m2.calculation}
 
 Owner:
-  1ï¸âƒ£ {m1['owner']}
-  2ï¸âƒ£ {m2['owner']}
+  1ï¸âƒ£ {m1.owner}
+  2ï¸âƒ£ {m2.owner}
 
 Trust Score:
   1ï¸âƒ£ {trust1}/100 {_get_score_emoji(trust1)}
   2ï¸âƒ£ {trust2}/100 {_get_score_emoji(trust2)}
 
 Usage:
-  1ï¸âƒ£ {m1['usage_count']} times
-  2ï¸âƒ£ {m2['usage_count']} times
+  1ï¸âƒ£ {m1.usage_count} times
+  2ï¸âƒ£ {m2.usage_count} times
 
 Data Source:
-  1ï¸âƒ£ {m1['data_source'] or 'Not specified'}
-  2ï¸âƒ£ {m2['data_source'] or 'Not specified'}
+  1ï¸âƒ£ {m1.data_source or 'Not specified'}
+  2ï¸âƒ£ {m2.data_source or 'Not specified'}
 
-"""
+""")
     
     # Recommendation
     if trust1 > trust2 + 10:
-        report += f"ðŸ’¡ Recommendation: '{m1['name']}' has higher trust - prefer using it\n"
+        report.line(f"ðŸ’¡ Recommendation: '{m1.name}' has higher trust - prefer using it")
     elif trust2 > trust1 + 10:
-        report += f"ðŸ’¡ Recommendation: '{m2['name']}' has higher trust - prefer using it\n"
-    elif m1['usage_count'] > m2['usage_count'] * 2:
-        report += f"ðŸ’¡ Recommendation: '{m1['name']}' is more widely used\n"
-    elif m2['usage_count'] > m1['usage_count'] * 2:
-        report += f"ðŸ’¡ Recommendation: '{m2['name']}' is more widely used\n"
+        report.line(f"ðŸ’¡ Recommendation: '{m2.name}' has higher trust - prefer using it")
+    elif m1.usage_count > m2.usage_count * 2:
+        report.line(f"ðŸ’¡ Recommendation: '{m1.name}' is more widely used")
+    elif m2.usage_count > m1.usage_count * 2:
+        report.line(f"ðŸ’¡ Recommendation: '{m2.name}' is more widely used")
     else:
-        report += "ðŸ’¡ Both metrics appear similar - review calculations to choose\n"
+        report.line("ðŸ’¡ Both metrics appear similar - review calculations to choose")
     
     # Check for potential duplicates
     similarity = _calculate_similarity(m1, m2)
     if similarity > 0.7:
-        report += f"\nâš ï¸ Warning: These metrics appear very similar ({int(similarity*100)}% match)\n"
-        report += "Consider consolidating them to reduce metric sprawl.\n"
+        report.line(f"\nâš ï¸ Warning: These metrics appear very similar ({int(similarity*100)}% match)")
+        report.line("Consider consolidating them to reduce metric sprawl.")
     
-    return report
+    return report.getvalue()
 
 
 @mcp.tool()
-def export_to_dbt(metric_name: str) -> str:
+def find_duplicates(threshold: float = 0.7) -> str:
     """
-    Export metric definition to dbt YAML format.
+    Find pairs of metrics that look like duplicates of each other.
+    
+    Uses the same similarity as compare_metrics (description words,
+    tags and data source) across every defined metric.
     
     Args:
-        metric_name: Name of the metric to export
+        threshold: Report pairs more similar than this (0-1)
         
     Returns:
-        dbt-compatible YAML definition
+        Likely duplicate pairs, most similar first
     """
-    metric_id = metric_name.lower().replace(" ", "_")
+    pairs = _find_duplicate_pairs(threshold)
+    if not pairs:
+        return f"No metric pairs above {int(threshold*100)}% similarity"
     
-    if metric_id not in METRICS_STORE:
-        return f"âŒ Metric '{metric_name}' not found."
+    top = nlargest(SEARCH_RESULT_LIMIT, pairs, key=itemgetter(0))
+    report = Report(f"""
+Possible Duplicate Metrics ({len(pairs)} pairs found)
+{'=' * 50}
+""")
+    if len(pairs) > len(top):
+        report.line(f"Showing the {len(top)} most similar - raise the threshold to narrow results")
     
-    metric = METRICS_STORE[metric_id]
+    for similarity, m1, m2 in top:
+        report.line(f"\n{int(similarity*100)}% match: {m1.name} <-> {m2.name}")
+        report.line(f"   Compare: compare_metrics('{m1.name}', '{m2.name}')")
     
-    # Generate dbt YAML
-    yaml_output = f"""
+    report.line("\nConsider consolidating duplicates to reduce metric sprawl.")
+    return report.getvalue()
+
+
+# dbt metric YAML, parsed once; only the placeholders vary per export.
+# A file is one header followed by an entry per metric.
+_DBT_HEADER = Template("""
 # dbt Semantic Layer Metric
 # Generated by Semantic Metrics Modeling Assistant
-# Created: {datetime.now().strftime("%Y-%m-%d")}
+# Created: $created
 
 version: 2
 
 metrics:
-  - name: {metric_id}
-    label: {metric['name']}
-    description: {metric['description']}
+""")
+_DBT_METRIC_TEMPLATE = Template("""  - name: $id
+    label: $name
+    description: $description
     
     calculation_method: derived
-    expression: {metric['calculation']}
+    expression: $calculation
     
     timestamp: updated_at
     time_grains: [day, week, month, quarter, year]
     
     dimensions:
-      {f"- {metric['data_source']}" if metric['data_source'] else "# Add dimensions here"}
+      $dimensions
     
     meta:
-      owner: {metric['owner']}
-      tags: {metric['tags']}
-      created_at: {metric['created_at']}
-      trust_score: {_calculate_trust_score(metric)}
-"""
+      owner: $owner
+      tags: $tags
+      created_at: $created_at
+      trust_score: $trust_score
+""")
+
+
+@mcp.tool()
+def export_to_dbt(metric_name: str) -> str:
+    """
+    Export metric definition to dbt YAML format.
+    
+    Args:
+        metric_name: Name of the metric to export
+        
+    Returns:
+        dbt-compatible YAML definition
+    """
+    metric_id, metric = _resolve_metric(metric_name)
+    if metric is None:
+        return _metric_not_found(metric_name)
+    
+    # Generate dbt YAML
+    now = datetime.now()
+    yaml_output = (
+        _DBT_HEADER.substitute(created=now.strftime("%Y-%m-%d"))
+        + _dbt_metric_yaml(metric, _calculate_trust_score(metric, now))
+    )
     
     report = f"""
-âœ… dbt Export for: {metric['name']}
+âœ… dbt Export for: {metric.name}
 {'=' * 50}
 
 ```yaml{yaml_output}
@@ -583,110 +849,211 @@ https://docs.getdbt.com/docs/build/metrics
     return report
 
 
+@mcp.tool()
+def export_all_to_dbt() -> str:
+    """
+    Export every defined metric to a single dbt YAML file.
+    
+    Returns:
+        dbt-compatible YAML with one entry per metric
+    """
+    if not METRICS_STORE:
+        return "No metrics defined yet. Use define_metric() to create your first metric."
+    
+    # One header, one clock read and one batch of trust scores for the file
+    now = datetime.now()
+    metrics = list(METRICS_STORE.values())
+    scores = _calculate_trust_scores(metrics, now)
+    yaml_output = _DBT_HEADER.substitute(created=now.strftime("%Y-%m-%d")) + "\n".join(
+        _dbt_metric_yaml(metric, score) for metric, score in zip(metrics, scores)
+    )
+    
+    return f"""
+dbt Export for {len(metrics)} metrics
+{'=' * 50}
+
+```yaml{yaml_output}
+```
+
+Next steps:
+1. Copy the YAML above to your dbt project
+2. Place in: models/metrics/metrics.yml
+3. Run: dbt compile
+"""
+
+
 # Helper functions
 
+def _dbt_metric_yaml(metric: Metric, trust_score: int) -> str:
+    """Render one metric's entry in a dbt metrics file."""
+    return _DBT_METRIC_TEMPLATE.substitute(
+        id=metric.id,
+        name=metric.name,
+        description=metric.description,
+        calculation=metric.calculation,
+        dimensions=f"- {metric.data_source}" if metric.data_source else "# Add dimensions here",
+        owner=metric.owner,
+        tags=metric._tags_json,
+        created_at=metric.created_at,
+        trust_score=trust_score,
+    )
+
+
+_NO_IDS: FrozenSet[str] = frozenset()
+
+# Simple regex to find potential table references (schema.table)
+_DEP_RE = re.compile(r'\b([a-zA-Z_]+\.[a-zA-Z_]+)\b')
+
+
+@lru_cache(maxsize=1024)
+def _normalize_id(name: str) -> str:
+    """Convert a metric name to its METRICS_STORE id."""
+    return name.lower().replace(" ", "_")
+
+
+def _resolve_metric(name: str) -> Tuple[str, Optional[Metric]]:
+    """Return the id for a metric name and the metric, or None if undefined."""
+    metric_id = _normalize_id(name)
+    return metric_id, METRICS_STORE.get(metric_id)
+
+
+def _metric_not_found(name: str) -> str:
+    """Build the not-found message for a metric name, with suggestions."""
+    msg = f"âŒ Metric '{name}' not found."
+    similar = _find_similar_metrics(name)
+    if similar:
+        msg += f"\n\nDid you mean: {', '.join(similar)}?"
+    return msg
+
+
 def _extract_dependencies(calculation: str) -> List[str]:
     """Extract metric and table dependencies from calculation."""
-    # Simple regex to find potential table references (schema.table)
-    pattern = r'\b([a-z_]+\.[a-z_]+)\b'
-    matches = re.findall(pattern, calculation.lower())
-    return list(set(matches))
+    # Lowercase each match rather than a copy of the whole calculation;
+    # de-duplicated in order of first appearance
+    return list(dict.fromkeys(match.lower() for match in _DEP_RE.findall(calculation)))
 
 
-def _calculate_trust_score(metric: Dict) -> int:
-    """Calculate overall trust score (0-100)."""
-    freshness = _check_freshness(metric)
-    tests = _check_test_coverage(metric)
-    usage = _check_usage(metric)
-    docs = _check_documentation(metric)
-    ownership = _check_ownership(metric)
+def _calculate_trust_score(metric: Metric, now: Optional[datetime] = None) -> int:
+    """
+    Calculate overall trust score (0-100).
     
-    return freshness + tests + usage + docs + ownership
+    The score is cached on the metric and reused until its update time,
+    usage or test count changes, or it ages by another whole day
+    (freshness is scored in days). Pass `now` to share one clock read
+    across a batch of metrics.
+    """
+    return _calculate_trust_scores([metric], now)[0]
+
+
+def _trust_breakdown(metric: Metric, now: Optional[datetime] = None) -> Tuple[int, int, int, int, int]:
+    """Return the cached (freshness, tests, usage, documentation, ownership) points."""
+    _calculate_trust_scores([metric], now)
+    return metric._trust_cache[2]
 
 
-def _check_freshness(metric: Dict) -> int:
+def _calculate_trust_scores(metrics: List[Metric], now: Optional[datetime] = None) -> List[int]:
+    """
+    Calculate trust scores for many metrics in one pass.
+    
+    The count-based checks are table lookups, so scoring a whole
+    search result avoids five helper calls per metric.
+    """
+    now = now or datetime.now()
+    scores = []
+    for metric in metrics:
+        # updated_at is read first; Metric.touch() sets it last, so the
+        # rest is at least as new as the timestamp the entry is keyed on
+        updated_at = metric.updated_at
+        usage_count = metric.usage_count
+        test_count = metric.test_count
+        age_days = (now - metric._updated_at_dt).days
+        key = (updated_at, usage_count, test_count, age_days)
+        cached = metric._trust_cache
+        if cached is not None and cached[0] == key:
+            scores.append(cached[1])
+            continue
+        
+        # Breakdown is kept alongside the total for check_trust_score
+        breakdown = (
+            _FRESHNESS_POINTS[bisect_left(_FRESHNESS_MAX_DAYS, age_days)],
+            _TEST_POINTS[bisect_right(_TEST_THRESHOLDS, test_count)],
+            _USAGE_POINTS[bisect_right(_USAGE_THRESHOLDS, usage_count)],
+            metric._doc_points,
+            metric._owner_points,
+        )
+        score = sum(breakdown)
+        metric._trust_cache = (key, score, breakdown)
+        scores.append(score)
+    return scores
+
+
+# Scoring tables: points[i] applies up to max_days[i] days old, or from
+# thresholds[i - 1] upwards for counts
+_FRESHNESS_MAX_DAYS = (0, 7, 30, 90)
+_FRESHNESS_POINTS = (20, 18, 15, 10, 5)
+_TEST_THRESHOLDS = (1, 3, 5)
+_TEST_POINTS = (0, 15, 20, 25)
+_USAGE_THRESHOLDS = (1, 5, 10, 20)
+_USAGE_POINTS = (0, 5, 10, 15, 20)
+
+
+def _check_freshness(metric: Metric, now: Optional[datetime] = None) -> int:
     """Check how fresh the metric is (0-20 points)."""
-    updated = datetime.fromisoformat(metric['updated_at'])
-    age_days = (datetime.now() - updated).days
-    
-    if age_days == 0:
-        return 20
-    elif age_days <= 7:
-        return 18
-    elif age_days <= 30:
-        return 15
-    elif age_days <= 90:
-        return 10
-    else:
-        return 5
+    age_days = ((now or datetime.now()) - metric._updated_at_dt).days
+    return _FRESHNESS_POINTS[bisect_left(_FRESHNESS_MAX_DAYS, age_days)]
 
 
-def _check_test_coverage(metric: Dict) -> int:
+def _check_test_coverage(metric: Metric) -> int:
     """Check test coverage (0-25 points)."""
-    tests = metric['test_count']
-    if tests >= 5:
-        return 25
-    elif tests >= 3:
-        return 20
-    elif tests >= 1:
-        return 15
-    else:
-        return 0
+    return _TEST_POINTS[bisect_right(_TEST_THRESHOLDS, metric.test_count)]
 
 
-def _check_usage(metric: Dict) -> int:
+def _check_usage(metric: Metric) -> int:
     """Check usage adoption (0-20 points)."""
-    usage = metric['usage_count']
-    if usage >= 20:
-        return 20
-    elif usage >= 10:
-        return 15
-    elif usage >= 5:
-        return 10
-    elif usage >= 1:
-        return 5
-    else:
-        return 0
+    return _USAGE_POINTS[bisect_right(_USAGE_THRESHOLDS, metric.usage_count)]
 
 
-def _check_documentation(metric: Dict) -> int:
+def _check_documentation(metric: Metric) -> int:
     """Check documentation completeness (0-20 points)."""
     score = 0
-    if metric['description']:
+    if metric.description:
         score += 10
-    if metric['data_source']:
+    if metric.data_source:
         score += 5
-    if metric['tags']:
+    if metric.tags:
         score += 5
     return score
 
 
-def _check_ownership(metric: Dict) -> int:
+def _check_ownership(metric: Metric) -> int:
     """Check ownership assignment (0-15 points)."""
-    if metric['owner'] and metric['owner'] != "Unassigned":
+    if metric.owner and metric.owner != "Unassigned":
         return 15
     else:
         return 0
 
 
+# Emoji and label for every integer trust score (0-100), built once
+_SCORE_EMOJI = tuple(
+    "ðŸŸ¢" if score >= 80 else "ðŸŸ¡" if score >= 60 else "ðŸ”´"
+    for score in range(101)
+)
+_SCORE_LABEL = tuple(
+    "Excellent - Production Ready" if score >= 80
+    else "Good - Minor Improvements Recommended" if score >= 60
+    else "Needs Improvement"
+    for score in range(101)
+)
+
+
 def _get_score_emoji(score: int) -> str:
     """Get emoji for score."""
-    if score >= 80:
-        return "ðŸŸ¢"
-    elif score >= 60:
-        return "ðŸŸ¡"
-    else:
-        return "ðŸ”´"
+    return _SCORE_EMOJI[min(max(score, 0), 100)]
 
 
 def _get_score_label(score: int) -> str:
     """Get label for score."""
-    if score >= 80:
-        return "Excellent - Production Ready"
-    elif score >= 60:
-        return "Good - Minor Improvements Recommended"
-    else:
-        return "Needs Improvement"
+    return _SCORE_LABEL[min(max(score, 0), 100)]
 
 
 def _get_check_mark(score: int, threshold: int) -> str:
@@ -694,10 +1061,9 @@ def _get_check_mark(score: int, threshold: int) -> str:
     return "âœ…" if score >= threshold else "âš ï¸"
 
 
-def _format_relative_time(iso_time: str) -> str:
+def _format_relative_time(dt: datetime, now: Optional[datetime] = None) -> str:
     """Format time as relative."""
-    dt = datetime.fromisoformat(iso_time)
-    delta = datetime.now() - dt
+    delta = (now or datetime.now()) - dt
     
     if delta.days == 0:
         return "today"
@@ -739,14 +1105,14 @@ def _get_usage_recommendation(score: int, usage: int) -> str:
         return ""
 
 
-def _get_doc_recommendation(score: int, metric: Dict) -> str:
+def _get_doc_recommendation(score: int, metric: Metric) -> str:
     """Get recommendation for documentation."""
     if score >= 15:
         return ""
     missing = []
-    if not metric['data_source']:
+    if not metric.data_source:
         missing.append("data source")
-    if not metric['tags']:
+    if not metric.tags:
         missing.append("tags")
     if missing:
         return f"âš ï¸ Add: {', '.join(missing)}"
@@ -760,23 +1126,23 @@ def _get_ownership_recommendation(score: int, owner: str) -> str:
     return ""
 
 
-def _generate_recommendations(metric: Dict, score: int) -> List[str]:
+def _generate_recommendations(metric: Metric, score: int) -> List[str]:
     """Generate improvement recommendations."""
     recs = []
     
-    if metric['test_count'] == 0:
+    if metric.test_count == 0:
         recs.append("Add validation tests")
     
-    if metric['owner'] == "Unassigned":
+    if metric.owner == "Unassigned":
         recs.append("Assign an owner")
     
-    if not metric['data_source']:
+    if not metric.data_source:
         recs.append("Specify the data source")
     
-    if not metric['tags']:
+    if not metric.tags:
         recs.append("Add relevant tags for discoverability")
     
-    if metric['usage_count'] == 0:
+    if metric.usage_count == 0:
         recs.append("Promote metric to increase adoption")
     
     if not recs:
@@ -785,16 +1151,54 @@ def _generate_recommendations(metric: Dict, score: int) -> List[str]:
     return recs
 
 
+def _trigrams(text: str) -> Set[str]:
+    """Return the distinct three-character substrings of text."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _index_name(name_lc: str, metric_id: str) -> None:
+    """Add every suffix of a lowercased metric name to NAME_TRIE."""
+    # Shortest suffix first, so the node each fallback link points to
+    # (the same path without its first character) already exists
+    shorter: List[_TrieNode] = []
+    for start in range(len(name_lc) - 1, -1, -1):
+        node = NAME_TRIE
+        path = []
+        for depth, char in enumerate(name_lc[start:]):
+            node = node.children.setdefault(char, _TrieNode())
+            node.ids[metric_id] = None
+            node.link = shorter[depth - 1] if depth else NAME_TRIE
+            path.append(node)
+        shorter = path
+
+
 def _find_similar_metrics(query: str) -> List[str]:
     """Find metrics with similar names."""
-    query_lower = query.lower()
-    similar = []
+    # Walk the query through the trie; on a mismatch fall back to the
+    # longest suffix of the matched text that can still be extended,
+    # remembering the node of the longest substring matched anywhere
+    node, length = NAME_TRIE, 0
+    best, best_length = NAME_TRIE, 0
+    for char in query.lower():
+        while node is not NAME_TRIE and char not in node.children:
+            node, length = node.link, length - 1
+        child = node.children.get(char)
+        if child is not None:
+            node, length = child, length + 1
+            if length > best_length:
+                best, best_length = node, length
+    
+    # The whole query, or a long enough piece of it after a typo
+    if best_length < min(len(query), _MIN_SIMILAR_MATCH):
+        return []
     
-    for metric_id, metric in METRICS_STORE.items():
-        if query_lower in metric['name'].lower():
-            similar.append(metric['name'])
-    
-    return similar[:5]
+    similar = []
+    for metric_id in best.ids:
+        if metric_id in METRICS_STORE:
+            similar.append(METRICS_STORE[metric_id].name)
+            if len(similar) == 5:
+                break
+    return similar
 
 
 def _build_dependency_tree(deps: List[str], depth: int, indent: str) -> str:
@@ -802,14 +1206,126 @@ def _build_dependency_tree(deps: List[str], depth: int, indent: str) -> str:
     if depth == 0 or not deps:
         return ""
     
-    tree = ""
-    for dep in deps:
-        tree += f"{indent}â””â”€â”€ {dep}\n"
-        if dep in METRICS_STORE:
-            sub_deps = METRICS_STORE[dep]['dependencies']
-            tree += _build_dependency_tree(sub_deps, depth - 1, indent + "    ")
+    # Iterative DFS; each frame is (memo key, output parts, remaining
+    # children, depth left for children, indent for children). Subtrees
+    # are memoized by (dep, depth), which also fixes their indent, so an
+    # upstream metric shared by several branches is rendered once.
+    memo: Dict[Tuple[str, int], str] = {}
+    stack = [(None, [], iter(deps), depth, indent)]
+    while True:
+        key, parts, children, child_depth, child_indent = stack[-1]
+        dep = next(children, None)
+        if dep is not None:
+            sub_key = (dep, child_depth)
+            if sub_key in memo:
+                parts.append(memo[sub_key])
+                continue
+            line = f"{child_indent}â””â”€â”€ {dep}\n"
+            sub_deps = METRICS_STORE[dep].dependencies if dep in METRICS_STORE else []
+            if child_depth > 1 and sub_deps:
+                stack.append((sub_key, [line], iter(sub_deps), child_depth - 1, child_indent + "    "))
+            else:
+                memo[sub_key] = line
+                parts.append(line)
+            continue
+        
+        stack.pop()
+        tree = "".join(parts)
+        if not stack:
+            return tree
+        memo[key] = tree
+        stack[-1][1].append(tree)
+
+
+def _store_metric(metric: Metric) -> None:
+    """Add a metric to METRICS_STORE, its search indexes and the lineage graph."""
+    metric_id = metric.id
+    METRICS_STORE[metric_id] = metric
+    _index_name(metric._name_lc, metric_id)
+    for tag in metric._tags_lc:
+        TAG_INDEX[tag].add(metric_id)
+    for gram in _trigrams(f"{metric._name_lc} {metric._desc_lc}"):
+        TRIGRAM_INDEX[gram].add(metric_id)
+    
+    # Update lineage graph
+    _invalidate_graph_caches()
+    for dep in metric.dependencies:
+        LINEAGE_GRAPH[dep].append(metric_id)
+
+
+def _upstream_graph(metric_id: str, depth: int) -> Tuple[Dict[str, Dict], List[Tuple[str, str]]]:
+    """
+    Nodes and edges upstream of a metric, up to ``depth`` levels.
+    
+    Built breadth-first, so each metric is expanded once, at its shallowest
+    depth. Results are cached until the metric graph next changes; callers
+    must copy them before modifying.
+    """
+    key = (metric_id, depth)
+    if key in _UPSTREAM_GRAPHS:
+        return _UPSTREAM_GRAPHS[key]
+    
+    nodes = {}
+    edges = []
+    visited = {metric_id}
+    queue = deque([(metric_id, 0)])
+    while queue:
+        mid, current_depth = queue.popleft()
+        m = METRICS_STORE[mid]
+        node_id = m._node_id
+        nodes[node_id] = {
+            'label': m.name,
+            'type': 'metric',
+            'is_root': mid == metric_id
+        }
+        
+        # Add edges for dependencies
+        for dep, dep_id in zip(m.dependencies, m._dep_node_ids):
+            # Determine if dependency is a table or metric
+            if dep_id in METRICS_STORE:
+                nodes[dep_id] = {
+                    'label': METRICS_STORE[dep_id].name,
+                    'type': 'metric',
+                    'is_root': dep_id == metric_id
+                }
+                # Expand metrics only, up to the requested depth
+                if current_depth < depth and dep_id not in visited:
+                    visited.add(dep_id)
+                    queue.append((dep_id, current_depth + 1))
+            else:
+                # It's a table/external source
+                nodes[dep_id] = {
+                    'label': dep,
+                    'type': 'table',
+                    'is_root': False
+                }
+            
+            edges.append((node_id, dep_id))
     
-    return tree
+    _UPSTREAM_GRAPHS[key] = nodes, edges
+    return nodes, edges
+
+
+def _mermaid_lines(nodes: Dict[str, Dict], edges: List[Tuple[str, str]]) -> Iterator[str]:
+    """Yield a Mermaid flowchart for the given nodes and edges, line by line."""
+    yield "```mermaid\n"
+    yield "graph TD\n"
+    
+    # Add nodes with labels, collecting their styles in the same pass
+    styles = []
+    for node_id, node_data in nodes.items():
+        node_template, style_template = _MERMAID_NODE_TEMPLATES[node_data['type'], node_data['is_root']]
+        yield node_template.substitute(id=node_id, label=node_data['label'])
+        styles.append(style_template.substitute(id=node_id))
+    
+    # Add edges
+    for source, target in edges:
+        yield f"    {source} --> {target}\n"
+    
+    # Add styling
+    yield "\n    %% Styling\n"
+    yield from styles
+    yield "```\n"
 
 
 def _is_table_reference(name: str) -> bool:
@@ -817,44 +1333,140 @@ def _is_table_reference(name: str) -> bool:
     return '.' in name
 
 
-def _has_circular_dependency(metric_id: str, visited: set = None) -> bool:
+def _invalidate_graph_caches() -> None:
+    """Drop cached cycle and lineage results after the metric graph changes."""
+    global _scc_dirty
+    _scc_dirty = True
+    _UPSTREAM_GRAPHS.clear()
+
+
+def _has_circular_dependency(metric_id: str) -> bool:
     """Check for circular dependencies."""
-    if visited is None:
-        visited = set()
-    
-    if metric_id in visited:
-        return True
-    
-    visited.add(metric_id)
-    
-    if metric_id in METRICS_STORE:
-        for dep in METRICS_STORE[metric_id]['dependencies']:
-            if dep in METRICS_STORE and _has_circular_dependency(dep, visited.copy()):
-                return True
-    
-    return False
+    global _scc_dirty
+    if _scc_dirty:
+        CYCLIC_IDS.clear()
+        CYCLIC_IDS.update(_find_cyclic_metrics())
+        _scc_dirty = False
+    return metric_id in CYCLIC_IDS
+
 
+def _find_cyclic_metrics() -> Set[str]:
+    """Find every metric that lies on or depends on a dependency cycle.
 
-def _calculate_similarity(m1: Dict, m2: Dict) -> float:
+    Iterative Tarjan over METRICS_STORE. Components are emitted with their
+    dependencies first, so a component is cyclic if it has more than one
+    member, depends on itself, or depends on an already cyclic metric.
+    """
+    index: Dict[str, int] = {}
+    lowlink: Dict[str, int] = {}
+    on_stack: Set[str] = set()
+    component_stack: List[str] = []
+    cyclic: Set[str] = set()
+    
+    for root in METRICS_STORE:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        component_stack.append(root)
+        on_stack.add(root)
+        stack = [(root, iter(METRICS_STORE[root].dependencies))]
+        while stack:
+            node, deps = stack[-1]
+            for dep in deps:
+                if dep not in METRICS_STORE:
+                    continue
+                if dep not in index:
+                    index[dep] = lowlink[dep] = len(index)
+                    component_stack.append(dep)
+                    on_stack.add(dep)
+                    stack.append((dep, iter(METRICS_STORE[dep].dependencies)))
+                    break
+                if dep in on_stack:
+                    lowlink[node] = min(lowlink[node], index[dep])
+            else:
+                stack.pop()
+                if stack:
+                    parent = stack[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] != index[node]:
+                    continue
+                
+                # node is the root of a strongly connected component
+                component = []
+                while True:
+                    member = component_stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                deps_of = [METRICS_STORE[member].dependencies for member in component]
+                if len(component) > 1 or any(
+                    dep == node or dep in cyclic for deps in deps_of for dep in deps
+                ):
+                    cyclic.update(component)
+    
+    return cyclic
+
+
+def _find_duplicate_pairs(threshold: float) -> List[Tuple[float, Metric, Metric]]:
+    """
+    Find metric pairs whose similarity is above threshold.
+    
+    Tags and data source contribute at most 0.6, so above that a pair
+    needs a minimum description overlap. Prefix filtering turns that into
+    candidates without comparing every pair: with each metric's words
+    ordered rarest first, two sets overlapping at least that much must
+    share a word among the first len - ceil(overlap * len) + 1 of each.
+    """
+    metrics = list(METRICS_STORE.values())
+    min_overlap = (threshold - 0.6) / 0.4
+    
+    if min_overlap <= 0:
+        candidates = [(m1, m2) for i, m1 in enumerate(metrics) for m2 in metrics[i + 1:]]
+    else:
+        frequency = Counter(word for metric in metrics for word in metric._desc_tokens)
+        prefix_index: Dict[str, List[Metric]] = defaultdict(list)
+        candidates = []
+        for metric in metrics:
+            words = sorted(metric._desc_tokens, key=lambda word: (frequency[word], word))
+            # Small epsilon so float error can only lengthen the prefix
+            prefix = len(words) - math.ceil(min_overlap * len(words) - 1e-9) + 1
+            seen: Set[str] = set()
+            for word in words[:prefix]:
+                for other in prefix_index[word]:
+                    if other.id not in seen:
+                        seen.add(other.id)
+                        candidates.append((other, metric))
+                prefix_index[word].append(metric)
+    
+    pairs = []
+    for m1, m2 in candidates:
+        similarity = _calculate_similarity(m1, m2)
+        if similarity > threshold:
+            pairs.append((similarity, m1, m2))
+    return pairs
+
+
+def _calculate_similarity(m1: Metric, m2: Metric) -> float:
     """Calculate similarity between two metrics (0-1)."""
     score = 0.0
     
     # Compare descriptions
-    desc1_words = set(m1['description'].lower().split())
-    desc2_words = set(m2['description'].lower().split())
+    desc1_words = m1._desc_tokens
+    desc2_words = m2._desc_tokens
     if desc1_words and desc2_words:
         desc_overlap = len(desc1_words & desc2_words) / len(desc1_words | desc2_words)
         score += desc_overlap * 0.4
     
     # Compare tags
-    tags1 = set(m1['tags'])
-    tags2 = set(m2['tags'])
+    tags1 = m1._tag_set
+    tags2 = m2._tag_set
     if tags1 or tags2:
         tag_overlap = len(tags1 & tags2) / max(len(tags1 | tags2), 1)
         score += tag_overlap * 0.3
     
     # Compare data sources
-    if m1['data_source'] == m2['data_source'] and m1['data_source']:
+    if m1.data_source == m2.data_source and m1.data_source:
         score += 0.3
     
     return score
@@ -877,17 +1489,14 @@ def export_to_looker(metric_name: str, view_name: str, explore: str = "") -> str
     """
     from semantic_metrics.exporters import generate_lookml
     
-    metric_id = metric_name.lower().replace(" ", "_")
-    
-    if metric_id not in METRICS_STORE:
-        return f" Metric ''{metric_name}'' not found."
-    
-    metric = METRICS_STORE[metric_id]
-    lookml = generate_lookml(metric, view_name, explore if explore else None)
+    metric_id, metric = _resolve_metric(metric_name)
+    if metric is None:
+        return _metric_not_found(metric_name)
+    lookml = generate_lookml(metric.to_dict(), view_name, explore if explore else None)
     
     report = f"""
- Looker LookML Export for: {metric[''name'']}
-{''='' * 50}
+ Looker LookML Export for: {metric.name}
+{'=' * 50}
 
 ```lookml
 {lookml}
@@ -900,7 +1509,7 @@ def export_to_looker(metric_name: str, view_name: str, explore: str = "") -> str
 4. Deploy to production
 
  Trust Score: {_calculate_trust_score(metric)}/100
-{''ℹ '' if metric[''owner''] else '' Assign an owner before deploying''}
+{'ℹ ' if metric.owner else ' Assign an owner before deploying'}
 """
     
     return report
@@ -920,17 +1529,14 @@ def export_to_tableau(metric_name: str, connection: str) -> str:
     """
     from semantic_metrics.exporters import generate_tds
     
-    metric_id = metric_name.lower().replace(" ", "_")
-    
-    if metric_id not in METRICS_STORE:
-        return f" Metric ''{metric_name}'' not found."
-    
-    metric = METRICS_STORE[metric_id]
-    tds = generate_tds(metric, connection)
+    metric_id, metric = _resolve_metric(metric_name)
+    if metric is None:
+        return _metric_not_found(metric_name)
+    tds = generate_tds(metric.to_dict(), connection)
     
     report = f"""
- Tableau TDS Export for: {metric[''name'']}
-{''='' * 50}
+ Tableau TDS Export for: {metric.name}
+{'=' * 50}
 
 ```xml
 {tds}
@@ -943,7 +1549,7 @@ def export_to_tableau(metric_name: str, connection: str) -> str:
 4. Select your saved .tds file
 
  Trust Score: {_calculate_trust_score(metric)}/100
-{''ℹ '' if metric[''owner''] else '' Assign an owner before sharing''}
+{'ℹ ' if metric.owner else ' Assign an owner before sharing'}
 """
     
     return report
@@ -970,73 +1576,90 @@ def calculate_trust_score_enhanced_tool(metric_name: str, show_history: bool = F
     Returns:
         Trust score with breakdown, trend, multipliers, and actionable recommendations
     """
-    from semantic_metrics.database import MetricsDatabase
-    
-    metric_id = metric_name.lower().replace(" ", "_")
-    
-    if metric_id not in METRICS_STORE:
-        return f" Metric ''{metric_name}'' not found."
-    
-    metric = METRICS_STORE[metric_id]
+    metric_id, metric = _resolve_metric(metric_name)
+    if metric is None:
+        return _metric_not_found(metric_name)
     
-    # Get database for history
-    db = MetricsDatabase()
-    history = db.get_metric_history(metric_id, limit=30)
+    # Get database for history. The trend comes from get_trend_counts, so
+    # only the recent changes the consistency bonus checks are read.
+    db = _PERSISTENCE or get_db()
+    history = db.get_metric_history(metric_id, limit=CONSISTENCY_WINDOW)
     
     # Calculate enhanced score
-    score_data = calculate_trust_score_enhanced(metric, history)
+    score_data = calculate_trust_score_enhanced(
+        metric.to_dict(), history, trend_counts=db.get_trend_counts(metric_id)
+    )
     
     # Build report
-    report = f"""
- Enhanced Trust Score for: {metric[''name'']}
-{''='' * 60}
+    report = Report(f"""
+ Enhanced Trust Score for: {metric.name}
+{'=' * 60}
 
-Overall Score: {get_score_emoji(score_data[''score''])} {score_data[''score'']}/100 {score_data[''trend'']}
-Grade: {get_score_label(score_data[''score''])}
+Overall Score: {get_score_emoji(score_data['score'])} {score_data['score']}/100 {score_data['trend']}
+Grade: {get_score_label(score_data['score'])}
 
  Factor Breakdown (Weighted):
-   Tests:         {score_data[''breakdown''][''tests'']}/35  (35% weight - MOST IMPORTANT)
-   Usage:         {score_data[''breakdown''][''usage'']}/20  (20% weight)
-   Freshness:     {score_data[''breakdown''][''freshness'']}/15  (15% weight)
-   Documentation: {score_data[''breakdown''][''documentation'']}/15  (15% weight)
-   Ownership:     {score_data[''breakdown''][''ownership'']}/15  (15% weight)
+   Tests:         {score_data['breakdown']['tests']}/35  (35% weight - MOST IMPORTANT)
+   Usage:         {score_data['breakdown']['usage']}/20  (20% weight)
+   Freshness:     {score_data['breakdown']['freshness']}/15  (15% weight)
+   Documentation: {score_data['breakdown']['documentation']}/15  (15% weight)
+   Ownership:     {score_data['breakdown']['ownership']}/15  (15% weight)
 
  Multipliers Applied:
-  Recent Activity: {score_data[''multipliers''][''recent_activity'']:+.0f} points
-  Consistency:     {score_data[''multipliers''][''consistency'']:+.0f} points
-  Time Decay:      {score_data[''multipliers''][''time_decay'']:.1f} points
-"""
+  Recent Activity: {score_data['multipliers']['recent_activity']:+.0f} points
+  Consistency:     {score_data['multipliers']['consistency']:+.0f} points
+  Time Decay:      {score_data['multipliers']['time_decay']:.1f} points
+""")
     
     # Show history if requested
     if show_history:
         trust_history = db.get_trust_score_history(metric_id, days=90)
         if trust_history and len(trust_history) >= 2:
-            scores = [h[''score''] for h in trust_history]
-            report += f"""
+            scores = [h['score'] for h in trust_history]
+            report.write(f"""
  Trust Score Trend (90 days):
   {generate_sparkline(scores[:30])}
   Current: {scores[0]:.1f} | 30d ago: {scores[min(30, len(scores)-1)]:.1f} | 90d ago: {scores[-1]:.1f}
   Change: {(scores[0] - scores[-1]):+.1f} points
-"""
+""")
         else:
-            report += "\n Trust Score Trend: Not enough history data yet\n"
+            report.line("\n Trust Score Trend: Not enough history data yet")
     
     # Add recommendations
-    if score_data[''recommendations'']:
-        report += "\n Recommendations:\n"
-        for rec in score_data[''recommendations'']:
-            report += f"  {rec}\n"
+    if score_data['recommendations']:
+        report.line("\n Recommendations:")
+        for rec in score_data['recommendations']:
+            report.line(f"  {rec}")
     
-    # Record this score
-    db.record_trust_score(metric_id, score_data[''score''], score_data[''breakdown''])
-    db.close()
+    # Record this score; metrics that only live in memory have no row for
+    # the snapshot to reference
+    if db.get_metric(metric_id) is not None:
+        db.record_trust_score(metric_id, score_data['score'], score_data['breakdown'])
     
-    return report
+    return report.getvalue()
 
 
 
 
 
+# Mermaid node and style lines by (node type, is root), so rendering a
+# node is one lookup instead of branching on its type and role
+_MERMAID_NODE_TEMPLATES = {
+    ('metric', True): (
+        Template("    $id[$label]\n"),
+        Template("    style $id fill:#4CAF50,color:#fff\n"),  # Green for root
+    ),
+    ('metric', False): (
+        Template("    $id[$label]\n"),
+        Template("    style $id fill:#2196F3,color:#fff\n"),  # Blue for metrics
+    ),
+    ('table', False): (
+        Template("    $id[($label)]\n"),  # Cylinder for tables
+        Template("    style $id fill:#9E9E9E,color:#fff\n"),  # Gray for tables
+    ),
+}
+
+
 @mcp.tool()
 def generate_mermaid_diagram(metric_name: str, depth: int = 3, include_downstream: bool = False) -> str:
     """
@@ -1052,105 +1675,35 @@ def generate_mermaid_diagram(metric_name: str, depth: int = 3, include_downstrea
     Returns:
         Mermaid diagram syntax ready to render in markdown
     """
-    metric_id = metric_name.lower().replace(" ", "_")
-    
-    if metric_id not in METRICS_STORE:
-        return f" Metric ''{metric_name}'' not found."
-    
-    metric = METRICS_STORE[metric_id]
+    metric_id, metric = _resolve_metric(metric_name)
+    if metric is None:
+        return _metric_not_found(metric_name)
     
-    # Build dependency graph
-    nodes = {}
-    edges = []
-    visited = set()
+    # Copies, so downstream nodes don't leak into the cached graph
+    upstream_nodes, upstream_edges = _upstream_graph(metric_id, depth)
+    nodes = dict(upstream_nodes)
+    edges = list(upstream_edges)
     
-    def add_dependencies(mid, current_depth):
-        if current_depth > depth or mid in visited:
-            return
-        visited.add(mid)
-        
-        if mid in METRICS_STORE:
-            m = METRICS_STORE[mid]
-            # Create sanitized node ID
-            node_id = mid.replace(" ", "_").replace("-", "_")
+    # Build downstream dependencies if requested, from the reverse index
+    if include_downstream:
+        root_id = metric._node_id
+        dependents = dict.fromkeys(LINEAGE_GRAPH.get(metric_id, []) + LINEAGE_GRAPH.get(metric.name, []))
+        for mid in dependents:
+            if mid not in METRICS_STORE:
+                continue
+            node_id = METRICS_STORE[mid]._node_id
             nodes[node_id] = {
-                ''label'': m[''name''],
-                ''type'': ''metric'',
-                ''is_root'': mid == metric_id
+                'label': METRICS_STORE[mid].name,
+                'type': 'metric',
+                'is_root': False
             }
-            
-            # Add edges for dependencies
-            for dep in m.get(''dependencies'', []):
-                dep_id = dep.replace(" ", "_").replace("-", "_").split(''.'')[0]
-                
-                # Determine if dependency is a table or metric
-                if dep_id in METRICS_STORE:
-                    nodes[dep_id] = {
-                        ''label'': METRICS_STORE[dep_id][''name''],
-                        ''type'': ''metric'',
-                        ''is_root'': False
-                    }
-                else:
-                    # It''s a table/external source
-                    nodes[dep_id] = {
-                        ''label'': dep,
-                        ''type'': ''table'',
-                        ''is_root'': False
-                    }
-                
-                edges.append((node_id, dep_id))
-                
-                # Recurse for metrics only
-                if dep_id in METRICS_STORE:
-                    add_dependencies(dep_id, current_depth + 1)
-    
-    # Build upstream dependencies
-    add_dependencies(metric_id, 0)
-    
-    # Build downstream dependencies if requested
-    if include_downstream:
-        for mid, m in METRICS_STORE.items():
-            if metric_id in m.get(''dependencies'', []) or metric[''name''] in m.get(''dependencies'', []):
-                node_id = mid.replace(" ", "_").replace("-", "_")
-                nodes[node_id] = {
-                    ''label'': m[''name''],
-                    ''type'': ''metric'',
-                    ''is_root'': False
-                }
-                edges.append((node_id, metric_id.replace(" ", "_").replace("-", "_")))
-    
-    # Generate Mermaid syntax
-    mermaid = "```mermaid\ngraph TD\n"
-    
-    # Add nodes with labels
-    for node_id, node_data in nodes.items():
-        label = node_data[''label'']
-        if node_data[''type''] == ''table'':
-            mermaid += f"    {node_id}[({label})]\n"  # Cylinder for tables
-        else:
-            mermaid += f"    {node_id}[{label}]\n"
-    
-    # Add edges
-    for source, target in edges:
-        mermaid += f"    {source} --> {target}\n"
-    
-    # Add styling
-    mermaid += "\n    %% Styling\n"
-    for node_id, node_data in nodes.items():
-        if node_data[''is_root'']:
-            mermaid += f"    style {node_id} fill:#4CAF50,color:#fff\n"  # Green for root
-        elif node_data[''type''] == ''metric'':
-            mermaid += f"    style {node_id} fill:#2196F3,color:#fff\n"  # Blue for metrics
-        else:
-            mermaid += f"    style {node_id} fill:#9E9E9E,color:#fff\n"  # Gray for tables
-    
-    mermaid += "```\n"
+            edges.append((node_id, root_id))
     
     report = f"""
- Dependency Diagram for: {metric[''name'']}
-{''='' * 60}
+ Dependency Diagram for: {metric.name}
+{'=' * 60}
 
-{mermaid}
+{"".join(_mermaid_lines(nodes, edges))}
 
  How to use:
 1. Copy the Mermaid diagram above
@@ -1241,6 +1794,8 @@ def main():
     """
     try:
         print("Starting Semantic Metrics Modeling Assistant...", file=sys.stderr)
+        loaded = enable_persistence()
+        print(f"Loaded {loaded} metrics from metrics.db", file=sys.stderr)
         print("Ready to help with metrics governance and observability", file=sys.stderr)
         
         # Run the server
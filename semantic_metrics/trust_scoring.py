@@ -1,11 +1,21 @@
 """Enhanced trust scoring with weighted factors, time-decay, and trend analysis."""
-import json
-from typing import Dict, Any, List, Optional
-from datetime import datetime, timedelta
-from collections import defaultdict
+from bisect import bisect_left, bisect_right
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+from functools import lru_cache
 
+# Trend indicators returned by calculate_trend
+TREND_UP = "↗️"
+TREND_STABLE = "→"
+TREND_DOWN = "↘️"
 
-def calculate_trust_score_enhanced(metric: Dict, history: List[Dict] = None) -> Dict[str, Any]:
+
+def calculate_trust_score_enhanced(
+    metric: Dict,
+    history: List[Dict] = None,
+    trend_counts: Optional[Tuple[int, int]] = None,
+    now: Optional[datetime] = None
+) -> Dict[str, Any]:
     """
     Calculate enhanced trust score with weights, history, and decay.
     
@@ -18,16 +28,102 @@ def calculate_trust_score_enhanced(metric: Dict, history: List[Dict] = None) ->
     Args:
         metric: Metric dictionary from database
         history: Optional metric history for trend calculation
+        trend_counts: Optional (last 30 days, 30-60 days) change counts, e.g.
+            from MetricsDatabase.get_trend_counts; used for the trend instead
+            of counting the history rows
+        now: Reference time for ages (defaults to the current time)
         
     Returns:
         Dict with score, breakdown, trend, multipliers, and recommendations
     """
+    updated_at = _parse_timestamp(metric['updated_at'])
+    created_at = _parse_timestamp(metric['created_at'])
+    now = now or datetime.now()
+    history_key = tuple(h['changed_at'] for h in history[:CONSISTENCY_WINDOW]) if history else ()
+
+    final_score, breakdown, multipliers, recommendations = _score_impl(
+        (now - updated_at).days,
+        (now - created_at).days,
+        metric.get('test_count', 0),
+        metric.get('usage_count', 0),
+        metric.get('description'),
+        metric.get('data_source'),
+        tuple(metric.get('tags') or ()),
+        bool(metric.get('dependencies')),
+        metric.get('owner'),
+        _is_consistent(history_key) if len(history or ()) >= 5 else False,
+    )
+
+    # Get trend
+    if trend_counts is not None:
+        trend = _trend_from_counts(*trend_counts)
+    else:
+        trend = calculate_trend(history, now) if history else TREND_STABLE
+
+    return {
+        "score": final_score,
+        "trend": trend,  # TREND_UP, TREND_STABLE or TREND_DOWN
+        "breakdown": dict(breakdown),
+        "multipliers": dict(multipliers),
+        "recommendations": list(recommendations)
+    }
+
+
+# Most recent changes the consistency bonus looks at; callers fetching
+# history only for scoring need no more rows than this
+CONSISTENCY_WINDOW = 10
+
+# Metric rows and their history are re-read on every tool call, so the same
+# ISO timestamps are parsed over and over
+_parse_timestamp = lru_cache(maxsize=4096)(datetime.fromisoformat)
+
+
+@lru_cache(maxsize=4096)
+def _is_consistent(history_key: Tuple[str, ...]) -> bool:
+    """Whether the given change timestamps (newest first) are at most 30 days apart."""
+    update_dates = [_parse_timestamp(changed_at) for changed_at in history_key]
+    if len(update_dates) < 2:
+        return False
+    gaps = [(update_dates[i] - update_dates[i+1]).days for i in range(len(update_dates)-1)]
+    return all(g <= 30 for g in gaps)  # Updated at least monthly
+
+
+@lru_cache(maxsize=4096)
+def _score_impl(
+    days_since_update: int,
+    days_since_creation: int,
+    test_count: int,
+    usage_count: int,
+    description: Optional[str],
+    data_source: Optional[str],
+    tags: Tuple[str, ...],
+    has_dependencies: bool,
+    owner: Optional[str],
+    consistent: bool
+) -> Tuple[float, tuple, tuple, tuple]:
+    """
+    Score a metric from the fields the algorithm actually reads.
+
+    Keyed on ages in days rather than raw timestamps so cached entries stay
+    correct as the clock moves. Returns immutable (score, breakdown,
+    multipliers, recommendations) so cached results can't be mutated by callers.
+    """
+    fields = {
+        'test_count': test_count,
+        'usage_count': usage_count,
+        'description': description,
+        'data_source': data_source,
+        'tags': list(tags),
+        'dependencies': has_dependencies,
+        'owner': owner,
+    }
+
     # Calculate base component scores with new weights
-    freshness_score = check_freshness(metric) * (15/20)  # 15% weight
-    test_score = check_test_coverage(metric) * (35/25)    # 35% weight (increased!)
-    usage_score = check_usage(metric) * 1.0               # 20% weight (same)
-    doc_score = check_documentation(metric) * (15/20)     # 15% weight
-    ownership_score = check_ownership(metric) * 1.0       # 15% weight (same)
+    freshness_score = _freshness_points(days_since_update) * (15/20)  # 15% weight
+    test_score = check_test_coverage(fields) * (35/25)    # 35% weight (increased!)
+    usage_score = check_usage(fields) * 1.0               # 20% weight (same)
+    doc_score = check_documentation(fields) * (15/20)     # 15% weight
+    ownership_score = check_ownership(fields) * 1.0       # 15% weight (same)
     
     base_score = (
         freshness_score +
@@ -42,7 +138,6 @@ def calculate_trust_score_enhanced(metric: Dict, history: List[Dict] = None) ->
     multipliers = {}
     
     # Recent activity boost (+10% max)
-    days_since_update = (datetime.now() - datetime.fromisoformat(metric['updated_at'])).days
     if days_since_update <= 7:
         multipliers['recent_activity'] = 10  # Used this week
         final_score += 10
@@ -53,22 +148,13 @@ def calculate_trust_score_enhanced(metric: Dict, history: List[Dict] = None) ->
         multipliers['recent_activity'] = 0
     
     # Consistency bonus (+5% if regularly updated)
-    if history and len(history) >= 5:
-        update_dates = [datetime.fromisoformat(h['changed_at']) for h in history[:10]]
-        if len(update_dates) > 1:
-            gaps = [(update_dates[i] - update_dates[i+1]).days for i in range(len(update_dates)-1)]
-            if all(g <= 30 for g in gaps):  # Updated at least monthly
-                multipliers['consistency'] = 5
-                final_score += 5
-            else:
-                multipliers['consistency'] = 0
-        else:
-            multipliers['consistency'] = 0
+    if consistent:
+        multipliers['consistency'] = 5
+        final_score += 5
     else:
         multipliers['consistency'] = 0
     
     # Time decay (older metrics lose trust)
-    days_since_creation = (datetime.now() - datetime.fromisoformat(metric['created_at'])).days
     if days_since_creation > 90 and days_since_update > 30:
         # Lose 5% per month of staleness
         decay = min(25, (days_since_update / 30) * 5)
@@ -80,13 +166,10 @@ def calculate_trust_score_enhanced(metric: Dict, history: List[Dict] = None) ->
     # Clamp to 0-100
     final_score = max(0, min(100, final_score))
     
-    # Get trend
-    trend = calculate_trend(history) if history else "→"
-    
     # Get recommendations
     recommendations = get_recommendations(
         final_score, 
-        metric, 
+        fields, 
         freshness_score, 
         test_score, 
         usage_score, 
@@ -95,65 +178,45 @@ def calculate_trust_score_enhanced(metric: Dict, history: List[Dict] = None) ->
         days_since_update
     )
     
-    return {
-        "score": round(final_score, 1),
-        "trend": trend,  # "↗️", "→", "↘️"
-        "breakdown": {
-            "freshness": round(freshness_score, 1),
-            "tests": round(test_score, 1),
-            "usage": round(usage_score, 1),
-            "documentation": round(doc_score, 1),
-            "ownership": round(ownership_score, 1)
-        },
-        "multipliers": multipliers,
-        "recommendations": recommendations
-    }
+    breakdown = (
+        ("freshness", round(freshness_score, 1)),
+        ("tests", round(test_score, 1)),
+        ("usage", round(usage_score, 1)),
+        ("documentation", round(doc_score, 1)),
+        ("ownership", round(ownership_score, 1)),
+    )
+    return round(final_score, 1), breakdown, tuple(multipliers.items()), tuple(recommendations)
 
 
-def check_freshness(metric: Dict) -> float:
+def check_freshness(metric: Dict, now: Optional[datetime] = None) -> float:
     """Check freshness (0-20 points, weighted to 15)."""
-    days_old = (datetime.now() - datetime.fromisoformat(metric['updated_at'])).days
-    
-    if days_old <= 7:
-        return 20
-    elif days_old <= 30:
-        return 15
-    elif days_old <= 90:
-        return 10
-    elif days_old <= 180:
-        return 5
-    else:
-        return 0
+    days_old = ((now or datetime.now()) - _parse_timestamp(metric['updated_at'])).days
+    return _freshness_points(days_old)
+
+
+# Scoring tables: points[i] applies up to max_days[i] days old, or from
+# thresholds[i - 1] upwards for counts
+_FRESHNESS_MAX_DAYS = (7, 30, 90, 180)
+_FRESHNESS_POINTS = (20, 15, 10, 5, 0)
+_TEST_THRESHOLDS = (1, 3, 5)
+_TEST_POINTS = (0, 15, 20, 25)
+_USAGE_THRESHOLDS = (1, 10, 20, 50)
+_USAGE_POINTS = (0, 5, 10, 15, 20)
+
+
+def _freshness_points(days_old: int) -> float:
+    """Freshness points for a metric last updated ``days_old`` days ago."""
+    return _FRESHNESS_POINTS[bisect_left(_FRESHNESS_MAX_DAYS, days_old)]
 
 
 def check_test_coverage(metric: Dict) -> float:
     """Check test coverage (0-25 points, weighted to 35)."""
-    test_count = metric.get('test_count', 0)
-    
-    if test_count >= 5:
-        return 25
-    elif test_count >= 3:
-        return 20
-    elif test_count >= 1:
-        return 15
-    else:
-        return 0
+    return _TEST_POINTS[bisect_right(_TEST_THRESHOLDS, metric.get('test_count', 0))]
 
 
 def check_usage(metric: Dict) -> float:
     """Check usage (0-20 points, stays at 20)."""
-    usage = metric.get('usage_count', 0)
-    
-    if usage >= 50:
-        return 20
-    elif usage >= 20:
-        return 15
-    elif usage >= 10:
-        return 10
-    elif usage >= 1:
-        return 5
-    else:
-        return 0
+    return _USAGE_POINTS[bisect_right(_USAGE_THRESHOLDS, metric.get('usage_count', 0))]
 
 
 def check_documentation(metric: Dict) -> float:
@@ -187,32 +250,62 @@ def check_ownership(metric: Dict) -> float:
         return 0
 
 
-def calculate_trend(history: List[Dict]) -> str:
+def calculate_trend(history: List[Dict], now: Optional[datetime] = None) -> str:
     """
     Calculate trust score trend based on history.
     
     Args:
         history: List of metric_history records
+        now: Reference time (defaults to the current time)
         
     Returns:
         "↗️" (improving), "→" (stable), "↘️" (degrading)
     """
     if not history or len(history) < 2:
-        return "→"  # Not enough data
+        return TREND_STABLE  # Not enough data
     
     # Count recent vs older activity as proxy for metric health
-    now = datetime.now()
-    recent_changes = len([h for h in history if 
-        (now - datetime.fromisoformat(h['changed_at'])).days <= 30])
-    older_changes = len([h for h in history if 
-        30 < (now - datetime.fromisoformat(h['changed_at'])).days <= 60])
-    
+    now = now or datetime.now()
+    ages = [(now - _parse_timestamp(h['changed_at'])).days for h in history]
+    recent_changes = sum(1 for days in ages if days <= 30)
+    older_changes = sum(1 for days in ages if 30 < days <= 60)
+    return _trend_from_counts(recent_changes, older_changes)
+
+
+def _trend_from_counts(recent_changes: int, older_changes: int) -> str:
+    """Trend arrow from change counts in the last 30 days and the 30 before."""
     if recent_changes > older_changes + 2:
-        return "↗️"  # Improving - more recent activity
+        return TREND_UP  # Improving - more recent activity
     elif recent_changes < older_changes - 2:
-        return "↘️"  # Degrading - less recent activity
+        return TREND_DOWN  # Degrading - less recent activity
     else:
-        return "→"  # Stable
+        return TREND_STABLE  # Stable
+
+
+# Fixed recommendation texts. The documentation hint depends only on which
+# of the three fields are missing, so all seven variants are built up front.
+_REC_EXCELLENT = "✅ Excellent - This metric is production-ready"
+_REC_ACTION_REQUIRED = "⚠️ Action required - Address critical issues before using in production"
+_REC_NO_TESTS = "🔴 CRITICAL: Add validation tests to verify metric accuracy"
+_REC_MORE_TESTS = "🟡 Add more tests for comprehensive coverage (target: 3+ tests)"
+_REC_NEW_METRIC = "💡 New metric - promote to stakeholders to increase adoption"
+_REC_LOW_USAGE = "💡 Low usage - ensure metric is discoverable and well-documented"
+_REC_STALE = "⚠️ Stale metric - review and update to maintain trust"
+_REC_REVIEW = "ℹ️ Consider reviewing - metrics should be validated regularly"
+_REC_NO_OWNER = "👤 Assign an owner for accountability and governance"
+_REC_DOCUMENTATION = {
+    (no_source, no_tags, no_description): "📝 Improve documentation: Add " + ", ".join(
+        name for name, missing in (
+            ("data source", no_source),
+            ("tags", no_tags),
+            ("detailed description", no_description),
+        ) if missing
+    )
+    for no_source in (False, True)
+    for no_tags in (False, True)
+    for no_description in (False, True)
+    if no_source or no_tags or no_description
+}
 
 
 def get_recommendations(
@@ -228,47 +321,46 @@ def get_recommendations(
     """Generate actionable recommendations based on score breakdown."""
     recommendations = []
     
+    # Overall assessment
+    if final_score >= 80:
+        recommendations.append(_REC_EXCELLENT)
+    elif final_score < 50:
+        recommendations.append(_REC_ACTION_REQUIRED)
+    
     # Prioritize tests (most important)
     if test_score < 15:
         if metric.get('test_count', 0) == 0:
-            recommendations.append("🔴 CRITICAL: Add validation tests to verify metric accuracy")
+            recommendations.append(_REC_NO_TESTS)
         else:
-            recommendations.append("🟡 Add more tests for comprehensive coverage (target: 3+ tests)")
+            recommendations.append(_REC_MORE_TESTS)
     
     # Usage recommendations
     if usage_score < 10:
         if metric.get('usage_count', 0) == 0:
-            recommendations.append("💡 New metric - promote to stakeholders to increase adoption")
+            recommendations.append(_REC_NEW_METRIC)
         else:
-            recommendations.append("💡 Low usage - ensure metric is discoverable and well-documented")
+            recommendations.append(_REC_LOW_USAGE)
     
     # Freshness recommendations
     if days_since_update > 90:
-        recommendations.append("⚠️ Stale metric - review and update to maintain trust")
+        recommendations.append(_REC_STALE)
     elif days_since_update > 30:
-        recommendations.append("ℹ️ Consider reviewing - metrics should be validated regularly")
+        recommendations.append(_REC_REVIEW)
     
     # Documentation recommendations
     if doc_score < 10:
-        missing = []
-        if not metric.get('data_source'):
-            missing.append("data source")
-        if not metric.get('tags') or len(metric['tags']) == 0:
-            missing.append("tags")
-        if not metric.get('description') or len(metric['description']) < 20:
-            missing.append("detailed description")
-        if missing:
-            recommendations.append(f"📝 Improve documentation: Add {', '.join(missing)}")
+        description = metric.get('description')
+        missing = (
+            not metric.get('data_source'),
+            not metric.get('tags'),
+            not description or len(description) < 20,
+        )
+        if any(missing):
+            recommendations.append(_REC_DOCUMENTATION[missing])
     
     # Ownership recommendation
     if ownership_score < 10:
-        recommendations.append("👤 Assign an owner for accountability and governance")
-    
-    # Overall assessment
-    if final_score >= 80:
-        recommendations.insert(0, "✅ Excellent - This metric is production-ready")
-    elif final_score < 50:
-        recommendations.insert(0, "⚠️ Action required - Address critical issues before using in production")
+        recommendations.append(_REC_NO_OWNER)
     
     return recommendations
 
@@ -285,34 +377,37 @@ def generate_sparkline(scores: List[float]) -> str:
     if max_score == min_score:
         return "▄" * len(scores)
     
-    sparkline_chars = ['▁', '▂', '▃', '▄', '▅', '▆', '▇', '█']
-    
-    sparkline = ""
-    for score in scores:
-        normalized = (score - min_score) / (max_score - min_score)
-        char_index = min(7, int(normalized * 8))
-        sparkline += sparkline_chars[char_index]
-    
-    return sparkline
+    span = max_score - min_score
+    return "".join(
+        _SPARKLINE_CHARS[min(7, int((score - min_score) / span * 8))]
+        for score in scores
+    )
+
+
+_SPARKLINE_CHARS = "▁▂▃▄▅▆▇█"
+
+
+# Emoji and labels by score band; the band is how many thresholds the
+# score reaches, so a lookup replaces the if/elif chain
+_SCORE_EMOJIS = ("🔴", "🔴", "🟡", "🟢")
+_SCORE_LABELS = (
+    "Poor - Needs Significant Work",
+    "Fair - Several Issues to Address",
+    "Good - Minor Improvements Recommended",
+    "Excellent - Production Ready",
+)
+
+
+def _score_band(score: float) -> int:
+    """Count the 40/60/80 thresholds the score reaches (0-3)."""
+    return (score >= 40) + (score >= 60) + (score >= 80)
 
 
 def get_score_emoji(score: float) -> str:
     """Get emoji indicator for score."""
-    if score >= 80:
-        return "🟢"
-    elif score >= 60:
-        return "🟡"
-    else:
-        return "🔴"
+    return _SCORE_EMOJIS[_score_band(score)]
 
 
 def get_score_label(score: float) -> str:
     """Get descriptive label for score."""
-    if score >= 80:
-        return "Excellent - Production Ready"
-    elif score >= 60:
-        return "Good - Minor Improvements Recommended"
-    elif score >= 40:
-        return "Fair - Several Issues to Address"
-    else:
-        return "Poor - Needs Significant Work"
+    return _SCORE_LABELS[_score_band(score)]
@@ -85,8 +85,10 @@ def metric_with_history(test_db, sample_metric):
     metric_id = test_db.create_metric(sample_metric)
     
     # Add some history
-    test_db.update_metric(metric_id, {"description": "Updated description"}, "user1")
-    test_db.update_metric(metric_id, {"owner": "@new-team"}, "user2")
-    test_db.update_metric(metric_id, {"tags": ["revenue", "updated"]}, "user3")
+    test_db.update_metrics_bulk([
+        (metric_id, {"description": "Updated description"}, "user1"),
+        (metric_id, {"owner": "@new-team"}, "user2"),
+        (metric_id, {"tags": ["revenue", "updated"]}, "user3"),
+    ])
     
     return metric_id
@@ -1,7 +1,9 @@
 """Tests for database operations."""
 import pytest
-from datetime import datetime
-from semantic_metrics.database import MetricsDatabase
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from semantic_metrics import database
+from semantic_metrics.database import MetricsDatabase, get_db
 
 
 class TestDatabaseCRUD:
@@ -27,6 +29,35 @@ class TestDatabaseCRUD:
         assert metric["description"] == sample_metric["description"]
         assert metric["tags"] == sample_metric["tags"]
     
+    def test_metric_row_mapping(self, test_db, sample_metric):
+        """Test metric rows behave like read-only mappings."""
+        metric = test_db.get_metric(test_db.create_metric(sample_metric))
+
+        assert metric.name == metric["name"] == sample_metric["name"]
+        assert metric.get("missing", "default") == "default"
+        assert set(metric) == set(metric.as_dict())
+        assert dict(metric) == metric.as_dict()
+        with pytest.raises(KeyError):
+            metric["missing"]
+
+    def test_create_metrics_bulk(self, test_db, sample_metric):
+        """Test creating several metrics in one transaction."""
+        second = dict(sample_metric, id="test_revenue_2", name="Test Revenue 2")
+        test_db.create_metrics_bulk([sample_metric, second])
+
+        assert test_db.get_metric("test_revenue") is not None
+        assert test_db.get_metric("test_revenue_2")["name"] == "Test Revenue 2"
+
+    def test_create_metrics_bulk_rolls_back(self, test_db, sample_metric):
+        """Test a failing row leaves none of the batch behind."""
+        test_db.create_metric(sample_metric)
+        new_metric = dict(sample_metric, id="brand_new")
+
+        with pytest.raises(Exception):
+            test_db.create_metrics_bulk([new_metric, sample_metric])
+
+        assert test_db.get_metric("brand_new") is None
+
     def test_get_nonexistent_metric(self, test_db):
         """Test getting a metric that doesn't exist."""
         metric = test_db.get_metric("nonexistent")
@@ -62,6 +93,42 @@ class TestDatabaseCRUD:
         assert history[0]["field_name"] == "description"
         assert history[0]["changed_by"] == "user1"
     
+    def test_update_tags_resyncs_tag_index(self, test_db, sample_metric):
+        """Test tag lookups follow tag updates."""
+        metric_id = test_db.create_metric(sample_metric)
+        test_db.update_metric(metric_id, {"tags": ["revenue", "updated"]}, "user1")
+
+        assert test_db.get_metrics_by_tag("updated")[0]["id"] == metric_id
+        assert test_db.get_metrics_by_tag("financial") == []
+        assert test_db.get_metric(metric_id)["tags"] == ["revenue", "updated"]
+
+    def test_update_unknown_field(self, test_db, sample_metric):
+        """Test updating a column that doesn't exist is rejected."""
+        metric_id = test_db.create_metric(sample_metric)
+        with pytest.raises(ValueError):
+            test_db.update_metric(metric_id, {"id = 'x' --": "boom"}, "user1")
+
+    def test_update_bulk_is_atomic(self, test_db, multiple_metrics):
+        """Test a bulk update with a missing metric leaves every row unchanged."""
+        with pytest.raises(ValueError):
+            test_db.update_metrics_bulk([
+                ("metric_1", {"owner": "@team-z"}, "user1"),
+                ("missing", {"owner": "@team-z"}, "user1"),
+            ])
+
+        assert test_db.get_metric("metric_1")["owner"] == "@team-a"
+        assert test_db.get_metric_history("metric_1") == []
+
+    @pytest.mark.parametrize("table", [
+        "metric_history", "validation_tests", "metric_usage", "trust_score_history", "metric_tags"
+    ])
+    def test_child_tables_are_indexed_by_metric(self, test_db, table):
+        """Test cascading deletes can seek each child table by metric_id."""
+        plan = test_db.conn.execute(
+            f"EXPLAIN QUERY PLAN SELECT * FROM {table} WHERE metric_id = ?", ("x",)
+        ).fetchall()
+        assert "USING" in plan[0]["detail"] and "INDEX" in plan[0]["detail"]
+
     def test_delete_metric(self, test_db, sample_metric):
         """Test deleting a metric."""
         metric_id = test_db.create_metric(sample_metric)
@@ -71,6 +138,19 @@ class TestDatabaseCRUD:
         metric = test_db.get_metric(metric_id)
         assert metric is None
 
+    def test_delete_cascades_to_child_tables(self, test_db, sample_metric):
+        """Test deleting a metric removes its history, usage and tags."""
+        metric_id = test_db.create_metric(sample_metric)
+        test_db.update_metric(metric_id, {"description": "New desc"}, "user1")
+        test_db.record_usage(metric_id, "dashboard_1")
+        test_db.record_trust_score(metric_id, 80.0, {})
+        test_db.delete_metric(metric_id)
+
+        assert test_db.get_metric_history(metric_id) == []
+        assert test_db.get_usage_stats(metric_id)["total_uses"] == 0
+        assert test_db.get_trust_score_history(metric_id) == []
+        assert test_db.get_metrics_by_tag("revenue") == []
+
 
 class TestDatabaseSearch:
     """Test search and filter functionality."""
@@ -92,6 +172,24 @@ class TestDatabaseSearch:
         results = test_db.search_metrics("nonexistent term")
         assert len(results) == 0
     
+    def test_search_prefix_match(self, test_db, multiple_metrics):
+        """Test partial words match as token prefixes."""
+        results = test_db.search_metrics("Thi")
+        assert [m["id"] for m in results] == ["metric_3"]
+
+    def test_search_ignores_query_syntax(self, test_db, multiple_metrics):
+        """Test FTS operators and quotes in user input don't raise."""
+        results = test_db.search_metrics('-"Second*(')
+        assert [m["id"] for m in results] == ["metric_2"]
+
+    def test_search_follows_updates_and_deletes(self, test_db, multiple_metrics):
+        """Test the search index stays in sync with metric writes."""
+        test_db.update_metric("metric_1", {"description": "Quarterly bookings"}, "user1")
+        assert [m["id"] for m in test_db.search_metrics("bookings")] == ["metric_1"]
+
+        test_db.delete_metric("metric_1")
+        assert test_db.search_metrics("bookings") == []
+
     def test_get_metrics_by_owner(self, test_db, multiple_metrics):
         """Test filtering by owner."""
         results = test_db.get_metrics_by_owner("@team-a")
@@ -103,6 +201,17 @@ class TestDatabaseSearch:
         results = test_db.get_metrics_by_tag("tag2")
         assert len(results) == 2
 
+    def test_get_metrics_by_tag_uses_index(self, test_db, multiple_metrics):
+        """Test tag lookups seek the tag index instead of scanning metrics."""
+        plan = test_db.conn.execute("""
+            EXPLAIN QUERY PLAN
+            SELECT m.* FROM metrics m
+            JOIN metric_tags t ON t.metric_id = m.id
+            WHERE t.tag = ?
+        """, ("tag2",)).fetchall()
+        details = " ".join(row["detail"] for row in plan)
+        assert "idx_metric_tags_tag" in details or "metric_tags USING" in details
+
 
 class TestDatabaseTracking:
     """Test history and usage tracking."""
@@ -114,7 +223,31 @@ class TestDatabaseTracking:
         
         stats = test_db.get_usage_stats(metric_id)
         assert stats["total_uses"] >= 1
-    
+
+    def test_usage_stats_window(self, test_db, sample_metric):
+        """Test usage outside the requested window is excluded."""
+        metric_id = test_db.create_metric(sample_metric)
+        test_db.record_usage(metric_id, "dashboard_1")
+        old = (datetime.now() - timedelta(days=45)).isoformat()
+        test_db.conn.execute(
+            "INSERT INTO metric_usage (metric_id, used_by, used_at) VALUES (?, ?, ?)",
+            (metric_id, "dashboard_2", old)
+        )
+
+        assert test_db.get_usage_stats(metric_id, days=30)["total_uses"] == 1
+        assert test_db.get_usage_stats(metric_id, days=60)["total_uses"] == 2
+
+    def test_counters_increment_in_place(self, test_db, sample_metric):
+        """Test usage and test counters are bumped by each insert."""
+        metric_id = test_db.create_metric(sample_metric)
+        test_db.record_usage(metric_id, "dashboard_1")
+        test_db.record_usage(metric_id, "dashboard_2")
+        test_db.add_validation_test(metric_id, {"test_type": "not_null", "status": "passed"})
+
+        metric = test_db.get_metric(metric_id)
+        assert metric["usage_count"] == sample_metric["usage_count"] + 2
+        assert metric["test_count"] == sample_metric["test_count"] + 1
+
     def test_get_metric_history(self, test_db, metric_with_history):
         """Test retrieving metric change history."""
         history = test_db.get_metric_history(metric_with_history)
@@ -122,6 +255,20 @@ class TestDatabaseTracking:
         assert all("field_name" in h for h in history)
         assert all("changed_by" in h for h in history)
     
+    def test_get_trend_counts(self, test_db, sample_metric):
+        """Test changes are bucketed by whole-day age like calculate_trend."""
+        metric_id = test_db.create_metric(sample_metric)
+        now = datetime.now()
+        ages = [timedelta(days=d, hours=h) for d, h in [(0, 1), (30, 23), (31, 0), (60, 23), (61, 0), (90, 0)]]
+        test_db.conn.executemany(
+            "INSERT INTO metric_history (metric_id, field_name, changed_at) VALUES (?, 'owner', ?)",
+            [(metric_id, (now - age).isoformat()) for age in ages]
+        )
+        test_db.conn.commit()
+
+        assert test_db.get_trend_counts(metric_id) == (2, 2)
+        assert test_db.get_trend_counts("missing") == (0, 0)
+
     def test_add_validation_test(self, test_db, sample_metric):
         """Test adding validation test results."""
         metric_id = test_db.create_metric(sample_metric)
@@ -138,6 +285,51 @@ class TestDatabaseTracking:
         metric = test_db.get_metric(metric_id)
         # Validation tests are stored separately, just verify no error
 
+    def test_close_checkpoints_wal(self, tmp_path, sample_metric):
+        """Test closing a file database leaves the WAL empty."""
+        db_path = tmp_path / "metrics.db"
+        db = MetricsDatabase(str(db_path))
+        assert db.conn.execute("PRAGMA wal_autocheckpoint").fetchone()[0] == 1000
+        db.create_metric(sample_metric)
+        db.get_metric(sample_metric["id"])
+        db.close()
+
+        wal = tmp_path / "metrics.db-wal"
+        assert not wal.exists() or wal.stat().st_size == 0
+        reopened = MetricsDatabase(str(db_path))
+        try:
+            assert reopened.get_metric(sample_metric["id"]) is not None
+        finally:
+            reopened.close()
+
+    def test_concurrent_writes(self, tmp_path, sample_metric):
+        """Test usage recorded from many threads is neither lost nor locked out."""
+        db = MetricsDatabase(str(tmp_path / "metrics.db"))
+        try:
+            metric_id = db.create_metric(sample_metric)
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                list(pool.map(
+                    lambda i: db.record_usage(metric_id, f"user_{i % 4}"),
+                    range(200)
+                ))
+                stats = list(pool.map(lambda _: db.get_usage_stats(metric_id), range(8)))
+
+            assert all(s["total_uses"] == 200 for s in stats)
+            assert db.get_metric(metric_id)["usage_count"] == sample_metric["usage_count"] + 200
+        finally:
+            db.close()
+
+    def test_get_db_is_shared(self, tmp_path, monkeypatch):
+        """Test get_db opens each path once and hands back the same instance."""
+        monkeypatch.setattr(database, "_SHARED_DBS", {})
+        first = get_db(str(tmp_path / "a.db"))
+        try:
+            assert get_db(str(tmp_path / "a.db")) is first
+            assert get_db(str(tmp_path / "b.db")) is not first
+        finally:
+            database._close_shared_dbs()
+        assert database._SHARED_DBS == {}
+
 
 class TestTrustScoreHistory:
     """Test trust score tracking."""
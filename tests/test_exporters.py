@@ -0,0 +1,177 @@
+"""Tests for BI tool exporters."""
+import json
+import xml.etree.ElementTree as ET
+
+import pytest
+from semantic_metrics.exporters import (
+    convert_to_looker_sql,
+    convert_to_tableau_formula,
+    determine_looker_type,
+    determine_tableau_datatype,
+    generate_lookml,
+    generate_tds,
+    _parse_calculation,
+)
+
+
+class TestTypeDetection:
+    """Test aggregate classification for measure types."""
+
+    @pytest.mark.parametrize("calculation,expected", [
+        ("SUM(amount)", "sum"),
+        ("avg(score)", "average"),
+        ("AVERAGE(score)", "average"),
+        ("COUNT(DISTINCT user_id)", "count_distinct"),
+        ("COUNT(*)", "count"),
+        ("MAX(amount)", "max"),
+        ("MIN(amount)", "min"),
+        ("amount * 2", "number"),
+        ("COUNT(order_id) / SUM(amount)", "sum"),
+    ])
+    def test_looker_type(self, calculation, expected):
+        """Test Looker measure type detection."""
+        assert determine_looker_type(calculation) == expected
+
+    @pytest.mark.parametrize("calculation,expected", [
+        ("COUNT(DISTINCT user_id)", "integer"),
+        ("SUM(amount)", "real"),
+        ("MAX(amount)", "real"),
+        ("amount", "string"),
+    ])
+    def test_tableau_datatype(self, calculation, expected):
+        """Test Tableau data type detection."""
+        assert determine_tableau_datatype(calculation) == expected
+
+
+class TestSqlConversion:
+    """Test SQL rewriting for Looker and Tableau."""
+
+    def test_looker_sql_field_references(self):
+        """Test table.column becomes a ${column} reference."""
+        sql = convert_to_looker_sql("SUM(transactions.amount) FROM transactions", "orders")
+        assert sql == "SUM(${amount})"
+
+    def test_looker_sql_where_becomes_comment(self):
+        """Test WHERE clauses are kept as a filter comment."""
+        sql = convert_to_looker_sql("SUM(amount) FROM transactions WHERE status='completed'", "orders")
+        assert sql.startswith("SUM(amount)")
+        assert "# Filter: status='completed'" in sql
+        assert "FROM" not in sql
+
+    def test_tableau_formula(self):
+        """Test table.column becomes [column] and clauses are dropped."""
+        formula = convert_to_tableau_formula(
+            "SUM(transactions.amount) FROM transactions WHERE status='completed'"
+        )
+        assert formula == "SUM([amount])"
+
+    def test_looker_filter_fields_are_rewritten(self):
+        """Test column references inside the WHERE filter are converted too."""
+        sql = convert_to_looker_sql(
+            "SUM(t.amount) FROM t WHERE t.status = 'completed'", "orders"
+        )
+        assert sql == "SUM(${amount})\n    # Filter: ${status} = 'completed'"
+
+    def test_multiline_where_is_split_off(self):
+        """Test a WHERE clause spanning lines is removed and kept as one filter comment."""
+        calculation = "SUM(t.amount)\nFROM t\nWHERE t.status = 'completed'\n  AND t.region = 'EU'"
+
+        assert convert_to_looker_sql(calculation, "orders") == (
+            "SUM(${amount})\n    # Filter: ${status} = 'completed' AND ${region} = 'EU'"
+        )
+        assert convert_to_tableau_formula(calculation) == "SUM([amount])"
+
+    def test_parse_is_shared_between_exporters(self):
+        """Test exporting to both tools parses the calculation once."""
+        calculation = "AVG(events.duration) FROM events WHERE events.kind = 'x'"
+        _parse_calculation.cache_clear()
+        convert_to_looker_sql(calculation, "events")
+        convert_to_tableau_formula(calculation)
+
+        info = _parse_calculation.cache_info()
+        assert (info.misses, info.hits) == (1, 1)
+
+
+class TestGenerators:
+    """Test full LookML and TDS documents."""
+
+    def test_lookml_includes_metadata(self, sample_metric):
+        """Test optional metadata lines are emitted in order."""
+        metric = dict(sample_metric, trust_score=87.5)
+        lookml = generate_lookml(metric, "orders", explore="sales")
+
+        assert lookml.startswith("view: orders {\n  measure: test_revenue {")
+        assert '    tags: ["revenue", "financial", "key-metric"]\n' in lookml
+        assert lookml.index("# Owner: @revenue-team") < lookml.index("# Trust Score: 87.5%")
+        assert lookml.endswith("  }\n}\n\n# Use in explore: sales\n")
+
+    def test_tds_includes_metadata(self, sample_metric):
+        """Test the TDS column carries metadata comments and is closed."""
+        tds = generate_tds(sample_metric, "warehouse")
+
+        assert '<named-connection name="warehouse" />' in tds
+        assert "<!-- Tags: revenue, financial, key-metric -->" in tds
+        assert "<!-- Owner: @revenue-team -->" in tds
+        assert tds.endswith("  </column>\n</datasource>\n")
+
+    def test_lookml_escapes_strings(self, sample_metric):
+        """Test quotes in names and descriptions stay inside the literal."""
+        metric = dict(sample_metric, name='Revenue "Net"', description="Ops' \\ finance")
+        lookml = generate_lookml(metric, "orders")
+
+        assert f"label: {json.dumps(metric['name'])}" in lookml
+        assert f"description: {json.dumps(metric['description'])}" in lookml
+
+    def test_tds_is_well_formed(self, sample_metric):
+        """Test quotes, ampersands and brackets don't break the XML."""
+        metric = dict(
+            sample_metric,
+            name="Rev & 'Co'",
+            description="Amount <net> of \"returns\"",
+            calculation="SUM(CASE WHEN a < 1 AND b = 'x' THEN 1 END)",
+        )
+        root = ET.fromstring(generate_tds(metric, "warehouse").encode("utf-8"))
+        column = root.find("column")
+
+        assert column.find("calculation").get("formula") == metric["calculation"]
+        assert column.find("desc").text == metric["description"]
+        assert column.find("aliases/alias").get("key") == metric["name"]
+
+    def test_lookml_comments_stay_on_one_line(self, sample_metric):
+        """Test newlines in owner and dependencies can't start new LookML lines."""
+        metric = dict(
+            sample_metric,
+            owner="@team\n  measure: injected {",
+            dependencies=["raw.orders\nsql: 1"],
+        )
+        lookml = generate_lookml(metric, "orders")
+
+        assert "    # Owner: @team measure: injected {\n" in lookml
+        assert "    # Dependencies: raw.orders sql: 1\n" in lookml
+        assert not any(line.lstrip().startswith(("measure: injected", "sql: 1"))
+                       for line in lookml.splitlines())
+
+    def test_lookml_keeps_non_ascii(self, sample_metric):
+        """Test non-ASCII labels and tags are written as-is, not as escapes."""
+        metric = dict(sample_metric, name="Umsatz (€)", description="Brutto – netto", tags=["données"])
+        lookml = generate_lookml(metric, "orders")
+
+        assert 'label: "Umsatz (€)"' in lookml
+        assert 'description: "Brutto – netto"' in lookml
+        assert 'tags: ["données"]' in lookml
+
+    def test_tds_comments_are_well_formed(self, sample_metric):
+        """Test dashes and newlines in comment metadata don't break the XML."""
+        metric = dict(
+            sample_metric,
+            owner="@team --> <injected/> <!--",
+            tags=["a--b", "line\nbreak"],
+            dependencies=["raw.orders-", "x---y"],
+        )
+        tds = generate_tds(metric, "warehouse")
+        root = ET.fromstring(tds.encode("utf-8"))
+
+        assert root.find("column/injected") is None
+        assert "<!-- Owner: @team -> <injected/> <!- -->" in tds
+        assert "<!-- Tags: a-b, line break -->" in tds
+        assert "<!-- Dependencies: raw.orders-, x-y -->" in tds
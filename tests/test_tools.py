@@ -0,0 +1,623 @@
+"""Tests for MCP server tools."""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from semantic_metrics import database, server
+
+
+@pytest.fixture(autouse=True)
+def clean_store():
+    """Give every test an empty in-memory metric store."""
+    server.METRICS_STORE.clear()
+    server.LINEAGE_GRAPH.clear()
+    server.NAME_TRIE.clear()
+    server._invalidate_graph_caches()
+    server.TAG_INDEX.clear()
+    server.TRIGRAM_INDEX.clear()
+    yield
+    server.METRICS_STORE.clear()
+    server.LINEAGE_GRAPH.clear()
+    server.NAME_TRIE.clear()
+    server._invalidate_graph_caches()
+    server.TAG_INDEX.clear()
+    server.TRIGRAM_INDEX.clear()
+
+
+@pytest.fixture
+def fast_thread_switching():
+    """Switch threads often so event-loop writes land mid-search."""
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+@pytest.fixture
+def defined_metric():
+    """Define a metric through the tool and return its id."""
+    server.define_metric(
+        name="Active Users",
+        description="Daily unique users",
+        calculation="SELECT COUNT(DISTINCT user_id) FROM raw.events",
+        owner="@data-team",
+        tags="engagement,daily",
+        data_source="raw.events",
+    )
+    return "active_users"
+
+
+class TestDefineAndSearch:
+    """Test defining and finding metrics."""
+
+    def test_define_metric(self, defined_metric):
+        """Test a defined metric is stored with parsed tags and dependencies."""
+        metric = server.METRICS_STORE[defined_metric]
+        assert metric.tags == ["engagement", "daily"]
+        assert metric.dependencies == ["raw.events"]
+        assert "_name_lc" not in metric.to_dict()
+
+    def test_extract_dependencies(self):
+        """Test table references are de-duplicated in order of appearance."""
+        calculation = "SUM(Sales.Orders.amount) / COUNT(raw.users) + MAX(sales.orders)"
+        assert server._extract_dependencies(calculation) == ["sales.orders", "raw.users"]
+
+    @pytest.mark.asyncio
+    async def test_search_metrics(self, defined_metric):
+        """Test search matches on name and filters on tags."""
+        assert "Active Users" in await server.search_metrics(query="active")
+        assert "No metrics found" in await server.search_metrics(tags="finance")
+
+    @pytest.mark.asyncio
+    async def test_search_is_case_insensitive(self, defined_metric):
+        """Test query and tag matching ignore case."""
+        assert "Active Users" in await server.search_metrics(query="DAILY UNIQUE")
+        assert "Active Users" in await server.search_metrics(tags="Finance, ENGAGEMENT")
+
+    @pytest.mark.asyncio
+    async def test_tag_filter_uses_index(self, defined_metric):
+        """Test tag filters match any listed tag and combine with the query."""
+        server.define_metric("Revenue", "Daily revenue", "SELECT 1", tags="Finance,daily")
+        assert server.TAG_INDEX["finance"] == {"revenue"}
+
+        report = await server.search_metrics(tags="finance,engagement")
+        assert "(2 metrics found)" in report
+        report = await server.search_metrics(query="revenue", tags="daily")
+        assert "(1 metrics found)" in report
+
+    @pytest.mark.asyncio
+    async def test_tag_filter_keeps_store_order_for_ties(self):
+        """Test equally trusted tag matches are listed in definition order."""
+        names = [f"Tagged Metric {i}" for i in range(20)]
+        for name in names:
+            server.define_metric(name, "Same score", "SELECT 1", tags="shared,other")
+
+        report = await server.search_metrics(tags="shared,other")
+        positions = [report.index(f"{name} (") for name in names]
+        assert positions == sorted(positions)
+
+    @pytest.mark.asyncio
+    async def test_query_uses_trigram_index(self, defined_metric):
+        """Test long queries are narrowed by trigrams and then confirmed."""
+        server.define_metric("Revenue", "Daily total of only users", "SELECT 1")
+
+        # Both metrics contain every trigram of "daily u", only one contains the phrase
+        report = await server.search_metrics(query="Daily U")
+        assert "(1 metrics found)" in report
+        assert "Active Users" in report
+        # Short queries fall back to a scan
+        assert "(2 metrics found)" in await server.search_metrics(query="us")
+        assert "No metrics found" in await server.search_metrics(query="zzz")
+
+    @pytest.mark.asyncio
+    async def test_query_keeps_store_order_for_ties(self):
+        """Test equally trusted trigram matches are listed in definition order."""
+        names = [f"Matched Metric {i}" for i in range(20)]
+        for name in names:
+            server.define_metric(name, "Same score", "SELECT 1")
+
+        report = await server.search_metrics(query="matched metric")
+        positions = [report.index(f"{name} (") for name in names]
+        assert positions == sorted(positions)
+
+    @pytest.mark.asyncio
+    async def test_concurrent_searches(self, defined_metric):
+        """Test searches can run concurrently on the event loop."""
+        results = await asyncio.gather(*(server.search_metrics(query="active") for _ in range(50)))
+        assert all("Active Users" in report for report in results)
+
+    @pytest.mark.asyncio
+    async def test_tag_search_during_define(self, fast_thread_switching):
+        """Test tag-filtered searches tolerate metrics defined meanwhile."""
+        for i in range(2000):
+            server.define_metric(f"Seed Metric {i}", "Seeded", "SELECT 1", tags="shared")
+
+        searches = asyncio.gather(*(server.search_metrics(tags="shared") for _ in range(50)))
+        late = 0
+        while not searches.done():
+            server.define_metric(f"Late Metric {late}", "Added later", "SELECT 1", tags="shared")
+            late += 1
+            await asyncio.sleep(0)
+
+        assert all("Search Results" in report for report in await searches)
+
+    @pytest.mark.asyncio
+    async def test_query_search_during_define_and_validate(self, fast_thread_switching):
+        """Test searches stay consistent with metrics defined and validated meanwhile."""
+        for i in range(2000):
+            server.define_metric(f"Seed Metric {i}", "Seeded", "SELECT 1")
+
+        searches = asyncio.gather(*(server.search_metrics(query="seed metric") for _ in range(50)))
+        late = 0
+        while not searches.done():
+            server.define_metric(f"Seed Metric Late {late}", "Added later", "SELECT 1")
+            server.validate_metric(f"Seed Metric {late}", "row count is positive")
+            late += 1
+            await asyncio.sleep(0)
+
+        assert all("Search Results" in report for report in await searches)
+        # Scores cached by the searches match a fresh scoring
+        now = datetime.now()
+        cached = [server._calculate_trust_score(m, now) for m in server.METRICS_STORE.values()]
+        for metric in server.METRICS_STORE.values():
+            metric._trust_cache = None
+        assert cached == [server._calculate_trust_score(m, now) for m in server.METRICS_STORE.values()]
+
+    @pytest.mark.asyncio
+    async def test_search_lists_top_results(self, defined_metric, monkeypatch):
+        """Test large result sets are cut to the most trusted metrics."""
+        monkeypatch.setattr(server, "SEARCH_RESULT_LIMIT", 1)
+        server.define_metric("Active Sessions", "Sessions", "SELECT 1")
+
+        report = await server.search_metrics(query="active")
+        assert "(2 metrics found)" in report
+        assert "Showing the 1 most trusted" in report
+        assert "Active Users" in report
+        assert "Active Sessions" not in report
+
+    def test_find_similar_metrics_matches_substrings(self, defined_metric):
+        """Test suggestions match anywhere in the name, ignoring case."""
+        server.define_metric("Active Sessions", "Sessions", "SELECT 1")
+        assert server._find_similar_metrics("ACTIVE") == ["Active Users", "Active Sessions"]
+        assert server._find_similar_metrics("ssion") == ["Active Sessions"]
+        assert server._find_similar_metrics("churn") == []
+
+    def test_find_similar_metrics_tolerates_typos(self, defined_metric):
+        """Test a typo still suggests names sharing a long enough piece of the query."""
+        server.define_metric("Revenue Per Customer", "Revenue", "SELECT 1")
+        assert server._find_similar_metrics("Actve Users") == ["Active Users"]
+        assert server._find_similar_metrics("revenue per custmer") == ["Revenue Per Customer"]
+        assert server._find_similar_metrics("usr") == []
+
+    def test_not_found_suggests_similar(self, defined_metric):
+        """Test a missing metric lookup suggests near matches."""
+        assert "Did you mean: Active Users?" in server.check_trust_score("Users")
+
+    def test_every_tool_resolves_names_the_same_way(self, defined_metric):
+        """Test lookups normalize names and share the not-found message."""
+        assert server._resolve_metric("ACTIVE USERS") == (
+            "active_users", server.METRICS_STORE[defined_metric]
+        )
+        for report in (
+            server.export_to_dbt("Users"),
+            server.export_to_looker("Users", "users"),
+            server.compare_metrics("Active Users", "Users"),
+        ):
+            assert report.startswith(server._metric_not_found("Users"))
+            assert "Did you mean: Active Users?" in report
+
+
+class TestCompare:
+    """Test metric comparison."""
+
+    def test_similar_metrics_are_flagged(self, defined_metric):
+        """Test near-duplicate definitions trigger the consolidation warning."""
+        server.define_metric(
+            name="Daily Actives",
+            description="Daily unique users",
+            calculation="SELECT COUNT(user_id) FROM raw.events",
+            tags="engagement,daily",
+            data_source="raw.events",
+        )
+        m1 = server.METRICS_STORE["active_users"]
+        m2 = server.METRICS_STORE["daily_actives"]
+
+        assert server._calculate_similarity(m1, m2) == pytest.approx(1.0)
+        assert "appear very similar (100% match)" in server.compare_metrics(
+            "Active Users", "Daily Actives"
+        )
+
+    def test_find_duplicates(self, defined_metric):
+        """Test only near-duplicate pairs are reported, most similar first."""
+        server.define_metric("Daily Actives", "Daily unique users", "SELECT 1",
+                             tags="engagement,daily", data_source="raw.events")
+        server.define_metric("Unique Users", "Unique users per day", "SELECT 1",
+                             tags="engagement,daily", data_source="raw.events")
+        server.define_metric("Revenue", "Total revenue", "SELECT 1", tags="finance")
+
+        pairs = server._find_duplicate_pairs(0.7)
+        assert sorted((m1.id, m2.id) for _, m1, m2 in pairs) == [
+            ("active_users", "daily_actives"),
+            ("active_users", "unique_users"),
+            ("daily_actives", "unique_users"),
+        ]
+        report = server.find_duplicates()
+        assert "(3 pairs found)" in report
+        assert "100% match: Active Users <-> Daily Actives" in report
+        assert "Revenue" not in report
+        assert "No metric pairs" in server.find_duplicates(threshold=1.0)
+
+
+class TestTrustScoreCache:
+    """Test trust score memoization."""
+
+    def test_score_is_cached(self, defined_metric, monkeypatch):
+        """Test repeated scoring of an unchanged metric skips the checks."""
+        metric = server.METRICS_STORE[defined_metric]
+        score = server._calculate_trust_score(metric)
+
+        def fail(*args):
+            raise AssertionError("trust score recomputed")
+
+        monkeypatch.setattr(server, "_check_documentation", fail)
+        assert server._calculate_trust_score(metric) == score
+
+    def test_report_reuses_cached_breakdown(self, defined_metric, monkeypatch):
+        """Test the trust report reads its component scores from the cache."""
+        metric = server.METRICS_STORE[defined_metric]
+        breakdown = server._trust_breakdown(metric)
+        assert sum(breakdown) == server._calculate_trust_score(metric)
+
+        def fail(*args):
+            raise AssertionError("trust score recomputed")
+
+        monkeypatch.setattr(server, "_check_documentation", fail)
+        assert f"Overall Trust Score: {sum(breakdown)}/100" in server.check_trust_score("Active Users")
+
+    def test_cache_expires_as_metric_ages(self, defined_metric):
+        """Test a cached score is recomputed once the metric is a day older."""
+        metric = server.METRICS_STORE[defined_metric]
+        now = metric._updated_at_dt
+        assert server._trust_breakdown(metric, now)[0] == 20
+        assert server._trust_breakdown(metric, now + timedelta(days=1))[0] == 18
+
+    def test_validate_invalidates_cache(self, defined_metric):
+        """Test adding a test is reflected in the next score."""
+        metric = server.METRICS_STORE[defined_metric]
+        before = server._calculate_trust_score(metric)
+        server.validate_metric("Active Users", "row count is positive")
+
+        assert server._calculate_trust_score(metric) == before + 15
+
+    def test_validate_reports_score_change(self, defined_metric):
+        """Test the validation report shows the score gained by the new test."""
+        assert "(+15)" in server.validate_metric("Active Users", "row count is positive")
+        assert "(+" not in server.validate_metric("Active Users")
+
+    def test_touch_rescores_static_checks(self, defined_metric):
+        """Test documentation and ownership points follow edits marked by touch()."""
+        metric = server.METRICS_STORE[defined_metric]
+        before = server._trust_breakdown(metric)
+        metric.owner = "Unassigned"
+        metric.tags = []
+        metric.touch()
+
+        after = server._trust_breakdown(metric)
+        assert (after[3], after[4]) == (before[3] - 5, 0)
+
+    def test_batch_matches_single_scores(self, defined_metric):
+        """Test batch scoring agrees with scoring metrics one at a time."""
+        server.define_metric("Sparse", "Barely documented", "SELECT 1")
+        metrics = list(server.METRICS_STORE.values())
+        metrics[1].test_count, metrics[1].usage_count = 4, 12
+        expected = [
+            sum(check(m) for check in (
+                server._check_freshness, server._check_test_coverage, server._check_usage,
+                server._check_documentation, server._check_ownership,
+            ))
+            for m in metrics
+        ]
+        assert server._calculate_trust_scores(metrics) == expected
+
+    @pytest.mark.parametrize("count,tests,usage", [
+        (0, 0, 0), (1, 15, 5), (3, 20, 5), (5, 25, 10), (10, 25, 15), (20, 25, 20),
+    ])
+    def test_count_thresholds(self, defined_metric, count, tests, usage):
+        """Test test and usage points at each threshold."""
+        metric = server.METRICS_STORE[defined_metric]
+        metric.test_count = metric.usage_count = count
+        assert server._check_test_coverage(metric) == tests
+        assert server._check_usage(metric) == usage
+
+    @pytest.mark.parametrize("score,label", [
+        (100, "Excellent - Production Ready"), (80, "Excellent - Production Ready"),
+        (79, "Good - Minor Improvements Recommended"), (60, "Good - Minor Improvements Recommended"),
+        (59, "Needs Improvement"), (0, "Needs Improvement"),
+    ])
+    def test_score_bands(self, score, label):
+        """Test labels and emoji switch at the 60 and 80 point bands."""
+        assert server._get_score_label(score) == label
+        band = server._SCORE_LABEL.index(label)
+        assert server._get_score_emoji(score) == server._SCORE_EMOJI[band]
+
+
+class TestFreshness:
+    """Test freshness scoring."""
+
+    def test_freshness_uses_given_now(self, defined_metric):
+        """Test freshness is scored against the caller's clock."""
+        metric = server.METRICS_STORE[defined_metric]
+        later = metric._updated_at_dt + timedelta(days=45)
+
+        assert server._check_freshness(metric, later) == 10
+        assert server._calculate_trust_score(metric, later) < server._calculate_trust_score(metric)
+
+    @pytest.mark.parametrize("days,points", [
+        (0, 20), (1, 18), (7, 18), (8, 15), (30, 15), (31, 10), (90, 10), (91, 5),
+    ])
+    def test_freshness_steps(self, defined_metric, days, points):
+        """Test freshness points at each age boundary."""
+        metric = server.METRICS_STORE[defined_metric]
+        assert server._check_freshness(metric, metric._updated_at_dt + timedelta(days=days)) == points
+
+    def test_relative_time_takes_parsed_datetime(self, defined_metric):
+        """Test relative times are formatted from the metric's parsed timestamp."""
+        metric = server.METRICS_STORE[defined_metric]
+        updated = metric._updated_at_dt
+        assert server._format_relative_time(updated, updated + timedelta(days=8)) == "1 weeks ago"
+        assert "Updated: today" in server.check_trust_score("Active Users")
+
+    def test_freshness_parses_stored_timestamps(self, defined_metric):
+        """Test freshness of a metric built from a stored ISO timestamp."""
+        metric = server.Metric(
+            name="Old", id="old", description="", calculation="",
+            updated_at=(datetime.now() - timedelta(days=3)).isoformat(),
+        )
+
+        assert server._check_freshness(metric) == 18
+
+
+class TestExports:
+    """Test BI export tools."""
+
+    def test_export_to_looker(self, defined_metric):
+        """Test the Looker export wraps generated LookML."""
+        report = server.export_to_looker("Active Users", "users")
+        assert "view: users {" in report
+        assert "Trust Score:" in report
+
+    def test_export_to_tableau(self, defined_metric):
+        """Test the Tableau export wraps generated TDS."""
+        report = server.export_to_tableau("Active Users", "warehouse")
+        assert "<datasource>" in report
+
+    def test_export_to_dbt(self, defined_metric):
+        """Test the dbt export fills every template field."""
+        report = server.export_to_dbt("Active Users")
+        assert "  - name: active_users\n    label: Active Users\n" in report
+        assert "expression: SELECT COUNT(DISTINCT user_id) FROM raw.events\n" in report
+        assert "      - raw.events\n" in report
+        assert '      tags: ["engagement", "daily"]\n' in report
+        assert "$" not in report
+
+    def test_export_all_to_dbt(self, defined_metric):
+        """Test a bulk export has one header and an entry per metric."""
+        server.define_metric("Revenue", "Total revenue", "SELECT SUM(amount) FROM raw.orders")
+        report = server.export_all_to_dbt()
+
+        assert "dbt Export for 2 metrics" in report
+        assert report.count("version: 2") == 1
+        assert "  - name: active_users\n" in report
+        assert "  - name: revenue\n" in report
+        single = server.export_to_dbt("Revenue")
+        assert single[single.index("  - name: revenue"):single.index("```\n")] in report
+
+
+class TestCircularDependencies:
+    """Test dependency cycle detection."""
+
+    def _store(self, metric_id, deps):
+        server.METRICS_STORE[metric_id] = server.Metric(
+            name=metric_id, id=metric_id, description="", calculation="", dependencies=deps
+        )
+
+    def test_chain_is_acyclic(self):
+        """Test a dependency chain with a shared node has no cycle."""
+        self._store("a", ["b", "c"])
+        self._store("b", ["c", "raw.table"])
+        self._store("c", [])
+        assert server._has_circular_dependency("a") is False
+        assert server.CYCLIC_IDS == set()
+
+    def test_cycle_is_detected(self):
+        """Test a cycle further down the graph is found."""
+        self._store("a", ["b"])
+        self._store("b", ["c"])
+        self._store("c", ["b"])
+        assert server._has_circular_dependency("a") is True
+        assert server.CYCLIC_IDS == {"a", "b", "c"}
+
+    def test_self_loop_and_independent_metrics(self):
+        """Test a self-dependency is a cycle and unrelated metrics are not."""
+        self._store("a", ["a"])
+        self._store("b", ["c"])
+        self._store("c", ["raw.table"])
+        self._store("d", ["a", "c"])
+        assert server._has_circular_dependency("a") is True
+        assert server.CYCLIC_IDS == {"a", "d"}
+
+    def test_define_metric_invalidates_memo(self):
+        """Test defining a metric that closes a cycle is detected."""
+        self._store("a", ["loop"])
+        assert server._has_circular_dependency("a") is False
+
+        server.define_metric("Loop", "Closes the loop", "SELECT 1")
+        server.METRICS_STORE["loop"].dependencies = ["a"]
+        assert server._has_circular_dependency("a") is True
+
+
+class TestLineage:
+    """Test lineage visualization."""
+
+    def test_downstream_reads_reverse_index(self, defined_metric):
+        """Test dependents come from the metric's own lineage entry."""
+        server.define_metric("Power Users", "Heavy users", "SELECT 1")
+        server.LINEAGE_GRAPH[defined_metric].append("power_users")
+
+        report = server.visualize_lineage("Active Users")
+        assert "Power Users" in report
+        assert "Direct dependents: 1" in report
+        assert "Direct dependents: 0" in server.visualize_lineage("Power Users")
+
+    def test_dependency_tree_is_depth_limited(self):
+        """Test the tree renders shared and cyclic dependencies up to depth."""
+        for metric_id, deps in {"a": ["b", "c"], "b": ["c"], "c": ["a", "raw.t"]}.items():
+            server.METRICS_STORE[metric_id] = server.Metric(
+                name=metric_id, id=metric_id, description="", calculation="", dependencies=deps
+            )
+
+        lines = server._build_dependency_tree(["b", "c"], 2, "").splitlines()
+        assert [line.split()[-1] for line in lines] == ["b", "c", "c", "a", "raw.t"]
+        assert [len(line) - len(line.lstrip()) for line in lines] == [0, 4, 0, 4, 4]
+
+    def test_mermaid_diagram_expands_shared_dependencies_once(self):
+        """Test a diamond renders each edge once and stops at the requested depth."""
+        server.define_metric("Top", "Top", "SELECT left_side.x, right_side.x")
+        server.define_metric("Left Side", "Left", "SELECT base.x")
+        server.define_metric("Right Side", "Right", "SELECT base.x")
+        server.define_metric("Base", "Base", "SELECT raw.events")
+
+        lines = server.generate_mermaid_diagram("Top", depth=2).splitlines()
+        edges = [line.strip() for line in lines if "-->" in line]
+        assert edges == [
+            "top --> left_side", "top --> right_side",
+            "left_side --> base", "right_side --> base", "base --> raw",
+        ]
+        shallow = server.generate_mermaid_diagram("Top", depth=1)
+        assert "left_side --> base" in shallow
+        assert "base --> raw" not in shallow
+
+    def test_mermaid_upstream_graph_is_cached_until_define(self):
+        """Test the upstream walk is reused until another metric is defined."""
+        server.define_metric("Top", "Top", "SELECT base.x")
+        server.generate_mermaid_diagram("Top", include_downstream=True)
+        assert ("top", 3) in server._UPSTREAM_GRAPHS
+        assert "base --> raw" not in server.generate_mermaid_diagram("Top")
+
+        server.define_metric("Base", "Base", "SELECT raw.events")
+        assert server._UPSTREAM_GRAPHS == {}
+        assert "base --> raw" in server.generate_mermaid_diagram("Top")
+
+    def test_mermaid_downstream_reads_reverse_index(self):
+        """Test dependents of a table come from the lineage graph."""
+        server.define_metric("Events", "Events", "SELECT 1")
+        server.define_metric("Event Count", "Count", "SELECT COUNT(*) FROM raw.events")
+        server.LINEAGE_GRAPH["events"].append("event_count")
+
+        diagram = server.generate_mermaid_diagram("Events", include_downstream=True)
+        assert "event_count --> events" in diagram
+
+
+class TestServer:
+    """Test the MCP server wrapper."""
+
+    @pytest.mark.asyncio
+    async def test_call_tool_respects_concurrency_limit(self):
+        """Test no more than max_concurrent_requests tools run at once."""
+        app = server.MetricsServer("test", max_concurrent_requests=2)
+        running = []
+        peak = []
+
+        @app.tool()
+        async def slow() -> str:
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+            return "done"
+
+        await asyncio.gather(*(app.call_tool("slow", {}) for _ in range(6)))
+        assert max(peak) == 2
+
+    def test_report_appends_after_initial_text(self):
+        """Test report lines are added after the header, not over it."""
+        report = server.Report("Header\n")
+        report.line("first")
+        report.write("second")
+        report.line()
+        assert report.getvalue() == "Header\nfirst\nsecond\n"
+
+
+class TestPersistence:
+    """Test write-through persistence of the metric store."""
+
+    def test_enhanced_score_records_persisted_metrics_only(self, tmp_path, monkeypatch):
+        """Test snapshots are recorded for stored metrics and skipped otherwise."""
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(server, "_PERSISTENCE", None)
+        monkeypatch.setattr(database, "_SHARED_DBS", {})
+        server.define_metric("Scratch", "Only in memory", "SELECT 1")
+        assert "Enhanced Trust Score for: Scratch" in server.calculate_trust_score_enhanced_tool("Scratch")
+        database._close_shared_dbs()
+
+        server.enable_persistence(str(tmp_path / "persisted.db"))
+        server.define_metric("Kept", "Written through", "SELECT 1")
+        report = server.calculate_trust_score_enhanced_tool("Kept")
+        assert "Enhanced Trust Score for: Kept" in report
+        assert len(server._PERSISTENCE.get_trust_score_history("kept")) == 1
+        database._close_shared_dbs()
+
+    def test_metrics_survive_restart(self, tmp_path, monkeypatch):
+        """Test defined and validated metrics are reloaded from the database."""
+        db_path = str(tmp_path / "metrics.db")
+        monkeypatch.setattr(server, "_PERSISTENCE", None)
+        monkeypatch.setattr(database, "_SHARED_DBS", {})
+        assert server.enable_persistence(db_path) == 0
+        assert server._PERSISTENCE is database.get_db(db_path)
+
+        server.define_metric("Active Users", "Daily unique users", "SELECT 1 FROM raw.events",
+                             owner="@data-team", tags="engagement")
+        server.validate_metric("Active Users", "row count is positive")
+        database._close_shared_dbs()
+
+        # Simulate a restart with an empty in-memory store
+        server.METRICS_STORE.clear()
+        server.LINEAGE_GRAPH.clear()
+        server.NAME_TRIE.clear()
+        server.TAG_INDEX.clear()
+        server.TRIGRAM_INDEX.clear()
+        assert server.enable_persistence(db_path) == 1
+        database._close_shared_dbs()
+
+        metric = server.METRICS_STORE["active_users"]
+        assert metric.test_count == 1
+        assert metric.dependencies == ["raw.events"]
+        assert server.LINEAGE_GRAPH["raw.events"] == ["active_users"]
+        assert server._find_similar_metrics("active") == ["Active Users"]
+
+    def test_validation_timestamp_survives_restart(self, tmp_path, monkeypatch):
+        """Test the timestamp a validation sets is the one reloaded."""
+        db_path = str(tmp_path / "metrics.db")
+        monkeypatch.setattr(server, "_PERSISTENCE", None)
+        monkeypatch.setattr(database, "_SHARED_DBS", {})
+        server.enable_persistence(db_path)
+        server.define_metric("Active Users", "Daily unique users", "SELECT 1")
+        metric = server.METRICS_STORE["active_users"]
+        defined_at = metric.updated_at
+        server.validate_metric("Active Users", "row count is positive")
+        validated_at = metric.updated_at
+        assert validated_at != defined_at
+        score = server._calculate_trust_score(metric)
+        database._close_shared_dbs()
+
+        server.METRICS_STORE.clear()
+        server.NAME_TRIE.clear()
+        server.TAG_INDEX.clear()
+        server.TRIGRAM_INDEX.clear()
+        server.enable_persistence(db_path)
+        database._close_shared_dbs()
+
+        reloaded = server.METRICS_STORE["active_users"]
+        assert reloaded.updated_at == validated_at
+        assert server._calculate_trust_score(reloaded) == score
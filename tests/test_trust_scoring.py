@@ -1,6 +1,7 @@
 """Tests for trust scoring algorithm."""
 import pytest
 from datetime import datetime, timedelta
+from functools import partial
 from semantic_metrics.trust_scoring import (
     calculate_trust_score_enhanced,
     check_freshness,
@@ -9,133 +10,155 @@ from semantic_metrics.trust_scoring import (
     check_documentation,
     check_ownership,
     calculate_trend,
-    generate_sparkline
+    generate_sparkline,
+    _score_impl
 )
 
+# Reference time for every test, read once at import and passed to the
+# scorer as `now`, so no age depends on when a test happens to run
+NOW = datetime.now()
+
+# Change histories for TestTrendCalculation, newest first
+IMPROVING_HISTORY = [
+    {"changed_at": (NOW - timedelta(days=i)).isoformat()}
+    for i in range(10)  # Many recent changes
+]
+STABLE_HISTORY = [
+    {"changed_at": (NOW - timedelta(days=days)).isoformat()}
+    for days in (5, 20, 40, 55)  # Two changes in each 30-day window
+]
+
+# Every character a multi-point sparkline may contain
+SPARK_BARS = frozenset("▁▂▃▄▅▆▇█")
+
+# Metrics scored by TestEnhancedScoring; calculate_trust_score_enhanced
+# doesn't modify its input, so tests share these
+PERFECT_METRIC = {
+    "id": "perfect",
+    "name": "Perfect Metric",
+    "description": "A perfect metric with all qualities",
+    "calculation": "SUM(amount) FROM transactions",
+    "owner": "@team",
+    "tags": ["revenue"],
+    "data_source": "transactions",
+    "dependencies": ["transactions.amount"],
+    "test_count": 5,
+    "usage_count": 100,
+    "created_at": NOW.isoformat(),
+    "updated_at": NOW.isoformat()
+}
+
+POOR_METRIC = {
+    "id": "poor",
+    "name": "Poor Metric",
+    "description": "",
+    "calculation": "SELECT *",
+    "owner": "Unassigned",
+    "tags": [],
+    "data_source": "",
+    "dependencies": [],
+    "test_count": 0,
+    "usage_count": 0,
+    "created_at": (NOW - timedelta(days=200)).isoformat(),
+    "updated_at": (NOW - timedelta(days=100)).isoformat()
+}
+
+STALE_METRIC = {
+    "id": "stale",
+    "name": "Stale Metric",
+    "description": "Old metric",
+    "calculation": "COUNT(*)",
+    "owner": "@team",
+    "tags": [],
+    "data_source": "table",
+    "dependencies": [],
+    "test_count": 2,
+    "usage_count": 10,
+    "created_at": (NOW - timedelta(days=200)).isoformat(),
+    "updated_at": (NOW - timedelta(days=90)).isoformat()
+}
+
+
+@pytest.fixture(scope="module")
+def enhanced_results():
+    """Score each shared metric once for every test in the module."""
+    return {
+        name: calculate_trust_score_enhanced(metric, now=NOW)
+        for name, metric in (("perfect", PERFECT_METRIC), ("poor", POOR_METRIC), ("stale", STALE_METRIC))
+    }
+
 
 class TestTrustScoreComponents:
     """Test individual scoring components."""
     
-    def test_freshness_recent(self):
-        """Test freshness score for recently updated metric."""
-        metric = {"updated_at": datetime.now().isoformat()}
-        score = check_freshness(metric)
-        assert score == 20  # Max score for today
-    
-    def test_freshness_old(self):
-        """Test freshness score for old metric."""
-        old_date = (datetime.now() - timedelta(days=200)).isoformat()
-        metric = {"updated_at": old_date}
-        score = check_freshness(metric)
-        assert score == 0  # Min score for very old
-    
-    def test_test_coverage_excellent(self):
-        """Test score for good test coverage."""
-        metric = {"test_count": 5}
-        score = check_test_coverage(metric)
-        assert score == 25  # Max score for 5+ tests
-    
-    def test_test_coverage_none(self):
-        """Test score for no tests."""
-        metric = {"test_count": 0}
-        score = check_test_coverage(metric)
-        assert score == 0
-    
-    def test_usage_high(self):
-        """Test score for high usage."""
-        metric = {"usage_count": 100}
-        score = check_usage(metric)
-        assert score == 20  # Max score
-    
-    def test_usage_none(self):
-        """Test score for no usage."""
-        metric = {"usage_count": 0}
-        score = check_usage(metric)
-        assert score == 0
-    
-    def test_documentation_complete(self):
-        """Test score for complete documentation."""
-        metric = {
+    @pytest.mark.parametrize("check,metric,expected", [
+        pytest.param(partial(check_freshness, now=NOW), {"updated_at": NOW.isoformat()}, 20,  # Max score for today
+                     id="freshness-recent"),
+        pytest.param(partial(check_freshness, now=NOW), {"updated_at": (NOW - timedelta(days=200)).isoformat()}, 0,
+                     id="freshness-old"),
+        pytest.param(check_test_coverage, {"test_count": 5}, 25,  # Max score for 5+ tests
+                     id="test-coverage-excellent"),
+        pytest.param(check_test_coverage, {"test_count": 0}, 0, id="test-coverage-none"),
+        pytest.param(check_usage, {"usage_count": 100}, 20, id="usage-high"),
+        pytest.param(check_usage, {"usage_count": 0}, 0, id="usage-none"),
+        pytest.param(check_documentation, {
             "description": "A very detailed description",
             "data_source": "transactions",
             "tags": ["tag1", "tag2"],
             "dependencies": ["dep1"]
-        }
-        score = check_documentation(metric)
-        assert score == 20  # Max score
-    
-    def test_ownership_assigned(self):
-        """Test score for assigned owner."""
-        metric = {"owner": "@data-team"}
-        score = check_ownership(metric)
-        assert score == 15  # Max score
+        }, 20, id="documentation-complete"),
+        pytest.param(check_ownership, {"owner": "@data-team"}, 15, id="ownership-assigned"),
+    ])
+    def test_component_score(self, check, metric, expected):
+        """Test each component check scores its input as expected."""
+        assert check(metric) == expected
 
 
 class TestEnhancedScoring:
     """Test the enhanced scoring algorithm."""
     
-    def test_perfect_score(self):
+    def test_perfect_score(self, enhanced_results):
         """Test metric with perfect scores in all areas."""
-        metric = {
-            "id": "perfect",
-            "name": "Perfect Metric",
-            "description": "A perfect metric with all qualities",
-            "calculation": "SUM(amount) FROM transactions",
-            "owner": "@team",
-            "tags": ["revenue"],
-            "data_source": "transactions",
-            "dependencies": ["transactions.amount"],
-            "test_count": 5,
-            "usage_count": 100,
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
-        }
-        
-        result = calculate_trust_score_enhanced(metric)
+        result = enhanced_results["perfect"]
         assert result["score"] >= 90  # Should be very high
         assert "breakdown" in result
         assert "trend" in result
     
-    def test_poor_score(self):
+    def test_poor_score(self, enhanced_results):
         """Test metric with poor scores."""
-        metric = {
-            "id": "poor",
-            "name": "Poor Metric",
-            "description": "",
-            "calculation": "SELECT *",
-            "owner": "Unassigned",
-            "tags": [],
-            "data_source": "",
-            "dependencies": [],
-            "test_count": 0,
-            "usage_count": 0,
-            "created_at": (datetime.now() - timedelta(days=200)).isoformat(),
-            "updated_at": (datetime.now() - timedelta(days=100)).isoformat()
-        }
-        
-        result = calculate_trust_score_enhanced(metric)
+        result = enhanced_results["poor"]
         assert result["score"] < 30  # Should be low
         assert len(result["recommendations"]) > 0
     
-    def test_time_decay(self):
+    def test_time_decay(self, enhanced_results):
         """Test that old metrics without updates lose trust."""
-        metric = {
-            "id": "stale",
-            "name": "Stale Metric",
-            "description": "Old metric",
-            "calculation": "COUNT(*)",
-            "owner": "@team",
-            "tags": [],
-            "data_source": "table",
-            "dependencies": [],
-            "test_count": 2,
-            "usage_count": 10,
-            "created_at": (datetime.now() - timedelta(days=200)).isoformat(),
-            "updated_at": (datetime.now() - timedelta(days=90)).isoformat()
-        }
-        
-        result = calculate_trust_score_enhanced(metric)
+        result = enhanced_results["stale"]
         assert result["multipliers"]["time_decay"] < 0  # Should have negative decay
+    
+    def test_reference_time_ages_metric(self):
+        """Test scoring at a later reference time treats the metric as stale."""
+        later = calculate_trust_score_enhanced(PERFECT_METRIC, now=NOW + timedelta(days=200))
+        assert later["breakdown"]["freshness"] == 0
+        assert later["multipliers"]["time_decay"] < 0
+    
+    def test_trend_counts_override_history(self):
+        """Test precomputed change counts are used for the trend."""
+        up = calculate_trust_score_enhanced(PERFECT_METRIC, trend_counts=(5, 1), now=NOW)
+        down = calculate_trust_score_enhanced(PERFECT_METRIC, trend_counts=(0, 3), now=NOW)
+        assert (up["trend"], down["trend"]) == ("↗️", "↘️")
+    
+    def test_unchanged_metric_is_cached(self):
+        """Test rescoring an unchanged metric reuses the cached computation."""
+        metric = PERFECT_METRIC | {"id": "cached", "test_count": 1, "usage_count": 3}
+        _score_impl.cache_clear()
+        first = calculate_trust_score_enhanced(metric, now=NOW)
+        first["recommendations"].clear()
+        first["breakdown"]["tests"] = 0
+        second = calculate_trust_score_enhanced(metric, now=NOW)
+        
+        assert _score_impl.cache_info().hits == 1
+        assert second["breakdown"]["tests"] == 21.0
+        assert len(second["recommendations"]) > 0
 
 
 class TestTrendCalculation:
@@ -143,21 +166,23 @@ class TestTrendCalculation:
     
     def test_improving_trend(self):
         """Test detection of improving metric."""
-        history = [
-            {"changed_at": (datetime.now() - timedelta(days=i)).isoformat()}
-            for i in range(10)  # Many recent changes
-        ]
-        trend = calculate_trend(history)
+        trend = calculate_trend(IMPROVING_HISTORY, NOW)
         assert trend in ["↗️", "→"]  # Improving or stable
     
     def test_stable_trend(self):
         """Test detection of stable metric."""
+        trend = calculate_trend(STABLE_HISTORY, NOW)
+        assert trend == "→"
+    
+    def test_trend_uses_reference_time(self):
+        """Test ages are measured from the given reference time."""
+        now = datetime(2024, 6, 1)
         history = [
-            {"changed_at": (datetime.now() - timedelta(days=i*10)).isoformat()}
-            for i in range(5)  # Evenly spaced changes
+            {"changed_at": (now - timedelta(days=40 + i)).isoformat()}
+            for i in range(5)
         ]
-        trend = calculate_trend(history)
-        assert trend == "→"
+        assert calculate_trend(history, now) == "↘️"
+        assert calculate_trend(history, now - timedelta(days=20)) == "↗️"
     
     def test_no_history(self):
         """Test trend with no history."""
@@ -168,20 +193,19 @@ class TestTrendCalculation:
 class TestSparkline:
     """Test sparkline generation."""
     
-    def test_sparkline_generation(self):
-        """Test generating ASCII sparkline."""
-        scores = [50, 60, 70, 80, 90, 85, 75, 80]
+    @pytest.mark.parametrize("scores", [
+        pytest.param([], id="empty"),
+        pytest.param([42], id="single"),
+        pytest.param([75, 75, 75, 75], id="flat"),
+        pytest.param([50, 60, 70, 80, 90, 85, 75, 80], id="varied"),
+        pytest.param([0, 100], id="full-range"),
+        pytest.param([12.5, 99.9, 3.1, 47.0], id="floats"),
+    ])
+    def test_sparkline_shape(self, scores):
+        """Test one bar per score, or a flat dash when there is nothing to plot."""
         sparkline = generate_sparkline(scores)
-        assert len(sparkline) == len(scores)
-        assert all(c in "▁▂▃▄▅▆▇█" for c in sparkline)
-    
-    def test_sparkline_flat(self):
-        """Test sparkline with flat data."""
-        scores = [75, 75, 75, 75]
-        sparkline = generate_sparkline(scores)
-        assert len(sparkline) == len(scores)
-    
-    def test_sparkline_empty(self):
-        """Test sparkline with no data."""
-        sparkline = generate_sparkline([])
-        assert sparkline == "─"
+        if len(scores) < 2:
+            assert sparkline == "─"
+        else:
+            assert len(sparkline) == len(scores)
+            assert set(sparkline) <= SPARK_BARS